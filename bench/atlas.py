@@ -0,0 +1,53 @@
+# frame time benchmark for Window.render on a dense map, with and without
+# the texture atlas, run from the repo root with sheets in input/
+#   python -m bench.atlas [frames]
+import os, sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from mods.glob import Glob
+from mods.sheets import Sheets
+
+def fill(glob: Glob, layers: int) -> int:
+  sheets = glob.sheets
+  assets = [(name, i, j) for name in sheets.sheet_names
+            for i, row in enumerate(sheets.get_sheet(name))
+            for j in range(len(row))]
+
+  # cover the whole zoomed out camera on every layer
+  w, h = glob.base_cam_size
+  w = int(w * glob.zoom_vals[-1] / glob.TILE_SIZE) + 2
+  h = int(h * glob.zoom_vals[-1] / glob.TILE_SIZE) + 2
+  n = 0
+  for layer in range(layers):
+    for x in range(-w, w):
+      for y in range(-h, h):
+        asset = assets[(x * 31 + y * 17 + layer) % len(assets)]
+        glob.tilemap.add_tile((x, y), 'tile', asset, str(layer))
+        n += 1
+  return n
+
+def bench(frames: int) -> None:
+  glob = Glob(1200, 800)
+  n = fill(glob, 3)
+
+  # zoom all the way out so every tile is on screen
+  glob.cam_zoom = glob.cam_zoom_t = glob.zoom_vals[-1]
+  glob.window.update_camera_size()
+  w, h = glob.curr_cam_size
+  glob.scroll = glob.scroll_t = [-w / 2, -h / 2]
+  glob.window.camera_rect.topleft = glob.scroll
+
+  for atlas in (False, True):
+    glob.sheets = Sheets(atlas=atlas)
+    glob.window.render()
+    start = time.perf_counter()
+    for _ in range(frames):
+      glob.window.render()
+    t = (time.perf_counter() - start) / frames
+    print(f'atlas {"on " if atlas else "off"}  {n} tiles  '
+          f'{t * 1000:7.2f}ms/frame')
+
+if __name__ == '__main__':
+  bench(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
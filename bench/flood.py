@@ -0,0 +1,26 @@
+# flood fill benchmark, fills empty square rects from 32x32 up to 1024x1024
+# tiles from their center, with and without autotiling
+#   python -m bench.flood [max side]
+import sys
+import time
+import pygame
+
+from mods.tilemap import TileMap
+
+def bench(max_side: int) -> None:
+  side = 32
+  while side <= max_side:
+    for autotile in (False, True):
+      tilemap = TileMap(16)
+      rect = pygame.Rect(0, 0, side * 16, side * 16)
+      start = time.perf_counter()
+      change = tilemap.flood((side // 2, side // 2), '0', rect,
+                             ('grass', 0, 0), autotile)
+      t = time.perf_counter() - start
+      n = len(change.added)
+      print(f'{side:>5}x{side:<5} autotile {"on " if autotile else "off"} '
+            f'{n:>8} cells  {t * 1000:9.1f}ms  {n / t / 1000:7.0f}k cells/s')
+    side *= 2
+
+if __name__ == '__main__':
+  bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
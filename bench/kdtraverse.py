@@ -0,0 +1,131 @@
+# kdtree traversal microbenchmark, runs the same range and nearest queries
+# through the old recursive traversal (which resized a pygame.Rect at every
+# node) and KDTree's explicit stack traversal, then k_nearest and
+# within_radius, printing nodes visited per second. the old traversal
+# pruned items centered just outside the query, so it visits and returns a
+# little less
+#   python -m bench.kdtraverse [points]
+import sys
+import time
+import random
+import pygame
+
+from mods.kd import KDTree, sq_dist
+
+# the old traversal, kept here to measure against
+def resize_rect(r: pygame.Rect, p: tuple, cmp: float,
+                vert: bool) -> pygame.Rect:
+  x, y = p
+  if vert and cmp < 0:
+    r = pygame.Rect(r.x, r.y, x - r.x, r.h)
+  elif vert and cmp >= 0:
+    r = pygame.Rect(x, r.y, r.right - x, r.h)
+  elif not vert and cmp < 0:
+    r = pygame.Rect(r.x, r.y, r.w, y - r.y)
+  else:
+    r = pygame.Rect(r.x, y, r.w, r.bottom - y)
+  r.normalize()
+  return r
+
+def rect_sq_dist(r: pygame.Rect, p: tuple) -> float:
+  x, y = p
+  rect_x = min(max(x, r.left), r.right)
+  rect_y = min(max(y, r.top), r.bottom)
+  return ((x - rect_x) ** 2) + ((y - rect_y) ** 2)
+
+def old_range(tree: KDTree, x: object, query: pygame.Rect,
+              curr_rect: pygame.Rect, found: list, vert: bool,
+              visited: list) -> None:
+  if not x:
+    return
+  if not query.colliderect(curr_rect):
+    return
+  visited[0] += 1
+  tree._test_rect.center = x.pos
+  if query.colliderect(tree._test_rect):
+    found.append(x.data)
+  old_range(tree, x.left, query, resize_rect(curr_rect, x.pos, -1, vert),
+            found, not vert, visited)
+  old_range(tree, x.right, query, resize_rect(curr_rect, x.pos, 1, vert),
+            found, not vert, visited)
+
+def old_nearest(x: object, pos: tuple, champ: object, curr_rect: pygame.Rect,
+                vert: bool, visited: list) -> object:
+  if not x:
+    return champ
+  if sq_dist(pos, champ.pos) < rect_sq_dist(curr_rect, pos):
+    return champ
+  visited[0] += 1
+  if sq_dist(pos, x.pos) < sq_dist(pos, champ.pos):
+    champ = x
+
+  near_left = (vert and pos[0] < x.pos[0]) or (not vert and pos[1] < x.pos[1])
+  first, second = (-1, 1) if near_left else (1, -1)
+  for cmp in (first, second):
+    curr_rect = resize_rect(curr_rect, x.pos, cmp, vert)
+    child = x.left if cmp < 0 else x.right
+    best = old_nearest(child, pos, champ, curr_rect, not vert, visited)
+    if sq_dist(pos, best.pos) < sq_dist(pos, champ.pos):
+      champ = best
+  return champ
+
+def bench(n: int) -> None:
+  rng = random.Random(0)
+  tree = KDTree(90)
+  tree.build(((rng.uniform(0, 20000), rng.uniform(0, 20000)), i)
+             for i in range(n))
+  rects = [pygame.Rect(rng.uniform(0, 19000), rng.uniform(0, 19000), 640, 360)
+           for _ in range(2000)]
+  points = [(rng.uniform(0, 20000), rng.uniform(0, 20000))
+            for _ in range(2000)]
+  bounds = pygame.Rect(-1, -1, 20002, 20002)
+
+  def report(name: str, t: float, visited: int, found: int) -> None:
+    print(f'{name:<16} {t * 1000:8.1f}ms  {visited:>9} nodes  '
+          f'{visited / t / 1e6:6.2f}M nodes/s  {found:>7} found')
+
+  visited = [0]
+  found = 0
+  start = time.perf_counter()
+  for query in rects:
+    out = []
+    old_range(tree, tree.root, query, query, out, True, visited)
+    found += len(out)
+  report('range old', time.perf_counter() - start, visited[0], found)
+
+  visited = found = 0
+  start = time.perf_counter()
+  for query in rects:
+    found += len(tree.range(query))
+    visited += tree.last_visited
+  report('range', time.perf_counter() - start, visited, found)
+
+  visited = [0]
+  start = time.perf_counter()
+  for p in points:
+    old_nearest(tree.root, p, tree.root, bounds, True, visited)
+  report('nearest old', time.perf_counter() - start, visited[0], len(points))
+
+  visited = 0
+  start = time.perf_counter()
+  for p in points:
+    tree.find_nearest(p, bounds)
+    visited += tree.last_visited
+  report('nearest', time.perf_counter() - start, visited, len(points))
+
+  visited = found = 0
+  start = time.perf_counter()
+  for p in points:
+    found += len(tree.k_nearest(p, 8))
+    visited += tree.last_visited
+  report('k_nearest 8', time.perf_counter() - start, visited, found)
+
+  visited = found = 0
+  start = time.perf_counter()
+  for p in points:
+    found += len(tree.within_radius(p, 200))
+    visited += tree.last_visited
+  report('within_radius', time.perf_counter() - start, visited, found)
+
+if __name__ == '__main__':
+  bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,82 @@
+# kdtree benchmark, inserts decor points in random, sorted and brush stroke
+# order and times range and nearest queries on the unbalanced tree, the
+# self balancing tree and a bulk built tree
+#   python -m bench.kdtree [points]
+import sys
+import time
+import random
+import pygame
+
+from mods.kd import KDTree
+
+# returns the points in the given insertion order
+def make_points(order: str, n: int, rng: random.Random) -> list:
+  if order == 'stroke':
+    # a brush wandering across the map a few pixels per dab
+    x, y, points = 0, 0, []
+    for _ in range(n):
+      x += rng.randrange(1, 8)
+      y += rng.randrange(-3, 8)
+      points.append((x, y))
+    return points
+
+  points = [(rng.randrange(0, 20000), rng.randrange(0, 20000))
+            for _ in range(n)]
+  if order == 'sorted':
+    points.sort()
+  return points
+
+# returns the depth of the deepest node
+def height(tree: KDTree) -> int:
+  deepest = 0
+  stack = [(tree.root, 1)]
+  while stack:
+    x, depth = stack.pop()
+    if x:
+      deepest = max(deepest, depth)
+      stack.append((x.left, depth + 1))
+      stack.append((x.right, depth + 1))
+  return deepest
+
+def bench(n: int) -> None:
+  # the unbalanced tree recurses once per level
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), n * 2 + 1000))
+  rng = random.Random(0)
+
+  for order in ('random', 'sorted', 'stroke'):
+    points = make_points(order, n, rng)
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    area = min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1
+    queries = [(rng.uniform(area[0], area[0] + area[2]),
+                rng.uniform(area[1], area[1] + area[3])) for _ in range(500)]
+    bounds = pygame.Rect(area[0] - 1, area[1] - 1, area[2] + 2, area[3] + 2)
+
+    for name in ('put alpha 1', 'put', 'build'):
+      start = time.perf_counter()
+      if name == 'build':
+        tree = KDTree(90)
+        tree.build((p, i) for i, p in enumerate(points))
+      else:
+        tree = KDTree(90, 1 if name == 'put alpha 1' else 0.7)
+        for i, p in enumerate(points):
+          tree.put(p, i)
+      t_insert = time.perf_counter() - start
+
+      start = time.perf_counter()
+      for x, y in queries:
+        tree.range(pygame.Rect(x, y, 320, 180))
+      t_range = time.perf_counter() - start
+
+      start = time.perf_counter()
+      for q in queries:
+        tree.find_nearest(q, bounds)
+      t_nearest = time.perf_counter() - start
+
+      print(f'{order:<7} {name:<12} height {height(tree):>6}  '
+            f'insert {t_insert * 1000:8.1f}ms  '
+            f'range {t_range / len(queries) * 1e6:8.1f}us  '
+            f'nearest {t_nearest / len(queries) * 1e6:8.1f}us')
+
+if __name__ == '__main__':
+  bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
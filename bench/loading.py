@@ -0,0 +1,36 @@
+# startup benchmark for loading every sheet in the input dir, first in process
+# and then with the process pool at 1 to N workers
+#   python -m bench.loading [input dir] [--cold]
+# --cold deletes the slice caches before each run so every sheet is rescanned
+import os, sys
+import time
+
+from mods.sheets import Sheets, CACHE_EXT
+
+def clear_caches(path: str) -> None:
+  for f in os.listdir(path):
+    if f.endswith(CACHE_EXT):
+      os.remove(os.path.join(path, f))
+
+def run(path: str, workers: int, cold: bool) -> float:
+  if cold:
+    clear_caches(path)
+  start = time.perf_counter()
+  sheets = Sheets(path)
+  if workers:
+    sheets.preload(workers=workers)
+  else:
+    for name in sheets.sheet_names:
+      sheets.get_sheet(name)
+  return time.perf_counter() - start
+
+def bench(path: str, cold: bool) -> None:
+  base = run(path, 0, cold)
+  print(f'in process  {base * 1000:9.1f}ms')
+  for workers in range(1, (os.cpu_count() or 1) + 1):
+    t = run(path, workers, cold)
+    print(f'{workers:>2} workers  {t * 1000:9.1f}ms  ({base / t:.2f}x)')
+
+if __name__ == '__main__':
+  args = [a for a in sys.argv[1:] if not a.startswith('--')]
+  bench(args[0] if args else 'input/', '--cold' in sys.argv)
@@ -0,0 +1,50 @@
+# memory benchmark for tile storage, fills a square of tiles on one layer
+# with the old per tile dict layout and with TileMap's chunk arrays
+#   python -m bench.memory [tiles]
+import sys
+import math
+import time
+import tracemalloc
+
+from mods.tilemap import TileMap
+
+# the per tile dicts TileMap used to keep, position -> {layer: tile info}
+def fill_dicts(side: int, tile_size: int) -> dict:
+  tiles = {}
+  for x in range(side):
+    for y in range(side):
+      pos = x, y
+      asset = 'grass', (x + y) % 16, x % 4
+      tile_info = {'pos':pos,
+                   'type':'tile',
+                   'asset':asset,
+                   'raw':[(x * tile_size, y * tile_size), asset]}
+      tiles[pos] = {'0':tile_info}
+  return tiles
+
+def fill_chunks(side: int, tile_size: int) -> TileMap:
+  tilemap = TileMap(tile_size)
+  for x in range(side):
+    for y in range(side):
+      tilemap.add_tile((x, y), 'tile', ('grass', (x + y) % 16, x % 4), '0')
+  return tilemap
+
+def measure(fill: callable, side: int) -> tuple[float, float]:
+  tracemalloc.start()
+  start = time.perf_counter()
+  storage = fill(side, 16)
+  t = time.perf_counter() - start
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  del storage
+  return size, t
+
+def bench(n: int) -> None:
+  side = math.isqrt(n)
+  for name, fill in (('dicts', fill_dicts), ('chunks', fill_chunks)):
+    size, t = measure(fill, side)
+    print(f'{name:<7} {side * side} tiles  {size / 2 ** 20:8.1f}MiB  '
+          f'{size / (side * side):6.1f}B/tile  built in {t:.1f}s')
+
+if __name__ == '__main__':
+  bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,39 @@
+# startup benchmark for sheet slicing, compares the bulk array slicer against
+# the pixel by pixel scan on every sheet in the input dir
+#   python -m bench.slicing [input dir]
+import os, sys
+import time
+import pygame
+
+from mods.sheets import find_rects, find_rects_scan
+
+def bench(path: str) -> None:
+  sheet_files = sorted(f for f in os.listdir(path) if f.endswith('.png'))
+  tot_scan = 0
+  tot_array = 0
+
+  for f in sheet_files:
+    sheet_surf = pygame.image.load(os.path.join(path, f))
+
+    start = time.perf_counter()
+    scanned = find_rects_scan(sheet_surf)
+    t_scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = find_rects(sheet_surf)
+    t_array = time.perf_counter() - start
+
+    tot_scan += t_scan
+    tot_array += t_array
+    status = 'ok' if found == scanned else 'MISMATCH'
+    n = sum(len(row) for row in found)
+    print(f'{f:<32} {sheet_surf.get_width()}x{sheet_surf.get_height()} '
+          f'{n:>5} assets  scan {t_scan * 1000:9.1f}ms  '
+          f'array {t_array * 1000:8.1f}ms  {status}')
+
+  if tot_array:
+    print(f'total  scan {tot_scan * 1000:.1f}ms  array {tot_array * 1000:.1f}ms'
+          f'  ({tot_scan / tot_array:.1f}x)')
+
+if __name__ == '__main__':
+  bench(sys.argv[1] if len(sys.argv) > 1 else 'input/')
@@ -0,0 +1,53 @@
+# interns (sheet, row, col) asset references into small integer ids so per
+# asset data can live in flat lists indexed by id instead of nested lookups
+class AssetPalette:
+  # init
+  def __init__(self):
+    self.ids = {}
+    self.assets = []
+
+    # ids of the same (sheet, col) indexed by row, shared between every id
+    # of that column so autotiling can swap rows without building a tuple
+    self.columns = {}
+    self.rows = []
+
+    # (x, y) render offset of every asset from its sheet config
+    self.offsets = []
+
+  # returns the id of an asset, assigning a new one on first sight
+  def intern(self, asset: tuple) -> int:
+    asset_id = self.ids.get(asset)
+    if asset_id is None:
+      asset = tuple(asset)
+      asset_id = len(self.assets)
+      self.ids[asset] = asset_id
+      self.assets.append(asset)
+      self.offsets.append((0, 0))
+
+      sheet, row, col = asset
+      rows = self.columns.setdefault((sheet, col), [])
+      if isinstance(row, int) and row >= 0:
+        rows.extend([None] * (row + 1 - len(rows)))
+        rows[row] = asset_id
+      self.rows.append(rows)
+    return asset_id
+
+  # returns the id of the asset on another row of the same column, which is
+  # where a sheet keeps an asset's autotile variants
+  def with_row(self, asset_id: int, row: int) -> int:
+    rows = self.rows[asset_id]
+    if row < len(rows) and rows[row] is not None:
+      return rows[row]
+    sheet, _, col = self.assets[asset_id]
+    return self.intern((sheet, row, col))
+
+  # returns the (sheet, row, col) of an asset id
+  def asset(self, asset_id: int) -> tuple:
+    return self.assets[asset_id]
+
+  # returns the ids of every interned asset from a sheet
+  def sheet_ids(self, sheet: str) -> list[int]:
+    return [i for i, asset in enumerate(self.assets) if asset[0] == sheet]
+
+# shared by every module so an id means the same asset everywhere
+palette = AssetPalette()
@@ -0,0 +1,73 @@
+# union find over the occupied cells of one layer. adding cells keeps it up
+# to date, removing any cell marks it dirty so it's rebuilt on next query
+class Components:
+  # init
+  def __init__(self):
+    self.parent = {}
+    self.sizes = {}
+    self.members = {}
+    self.count = 0
+
+    # starts dirty so layers nobody selects from never build an index
+    self.dirty = True
+
+  # returns the root cell of a cell's component
+  def find(self, pos: tuple) -> tuple:
+    parent = self.parent
+    while parent[pos] != pos:
+      parent[pos] = parent[parent[pos]]
+      pos = parent[pos]
+    return pos
+
+  # joins the components of two cells, the smaller into the larger
+  def union(self, a: tuple, b: tuple) -> None:
+    a, b = self.find(a), self.find(b)
+    if a == b:
+      return
+    if self.sizes[a] < self.sizes[b]:
+      a, b = b, a
+    self.parent[b] = a
+    self.sizes[a] += self.sizes.pop(b)
+    self.members[a].extend(self.members.pop(b))
+    self.count -= 1
+
+  # adds an occupied cell, joining it with its occupied neighbors
+  def add(self, pos: tuple) -> None:
+    if self.dirty or pos in self.parent:
+      return
+    self.parent[pos] = pos
+    self.sizes[pos] = 1
+    self.members[pos] = [pos]
+    self.count += 1
+
+    x, y = pos
+    for neighbor in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+      if neighbor in self.parent:
+        self.union(pos, neighbor)
+
+  # a removal can split a component, so the index waits for a rebuild
+  def remove(self, pos: tuple) -> None:
+    if pos in self.parent:
+      self.dirty = True
+
+  # rebuilds the index from every occupied cell of the layer
+  def rebuild(self, cells: iter) -> None:
+    self.parent = {}
+    self.sizes = {}
+    self.members = {}
+    self.count = 0
+    self.dirty = False
+    for pos in cells:
+      self.add(pos)
+
+  # returns the cells in the same component as pos
+  def component(self, pos: tuple) -> list:
+    if pos not in self.parent:
+      return []
+    return self.members[self.find(pos)]
+
+  # returns the size of the component containing pos
+  def size(self, pos: tuple) -> int:
+    if pos not in self.parent:
+      return 0
+    return self.sizes[self.find(pos)]
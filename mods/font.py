@@ -1,38 +1,71 @@
+from collections import OrderedDict
+
 from pygame import Surface
 from pygame.font import Font as pgfont
 
 class Font(pgfont):
     ''' this class extends from the pygame font class for more uses '''
 
-    def __init__(self, filename, size, color=(255, 255, 255)):
+    def __init__(self, filename, size, color=(255, 255, 255), cache_size=256):
         super().__init__(filename, size)
         self.font_size = size
         self._color = color
 
+        # lru caches of rendered text blocks and of their individual lines
+        self.cache_size = cache_size
+        self._txt_cache = OrderedDict()
+        self._line_cache = OrderedDict()
+
+    def _cached(self, cache : OrderedDict, key : tuple) -> object:
+        ''' returns a cached value and marks it as recently used '''
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _cache(self, cache : OrderedDict, key : tuple, value : object) -> None:
+        ''' caches a value, evicting the least recently used past the limit '''
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def render_line(self, txt : str) -> tuple[Surface, tuple[int, int]]:
+        ''' returns a rendered single line of text with its measured size '''
+        key = txt, self._color
+        line = self._cached(self._line_cache, key)
+        if line is None:
+            line = self.render(txt, False, self._color), self.size(txt)
+            self._cache(self._line_cache, key, line)
+        return line
+
     def render_txt(self, txt : str, dest : Surface, loc : tuple[float, float], 
                           ctrd : bool=False, align_ctr : bool=False) -> Surface:
         ''' renders a surf with rendered text to the screen ''' 
 
-        # check if there are new line commands
-        if '\n' in txt:
-            txts = txt.split('\n')
-            sizes = [self.size(txt) for txt in txts]
-            width = max([size[0] for size in sizes])
-            height = sum([size[1] for size in sizes]) + len(txts)
+        key = txt, self._color, align_ctr
+        txt_surf = self._cached(self._txt_cache, key)
+
+        # check if there are new line commands, only changed lines rerender
+        if txt_surf is None and '\n' in txt:
+            lines = [self.render_line(txt) for txt in txt.split('\n')]
+            width = max([size[0] for _, size in lines])
+            height = sum([size[1] for _, size in lines]) + len(lines)
             txt_surf = Surface((width, height))
             txt_surf.set_colorkey((0, 0, 0))
 
             x = 0
             y = 0
-            for i, txt in enumerate(txts):
+            for line, size in lines:
                 if align_ctr:
-                    x = (width - sizes[i][0]) // 2
-                txt_surf.blit(self.render(txt, False, self._color), (x, y))
-                y += sizes[i][1] + 1
+                    x = (width - size[0]) // 2
+                txt_surf.blit(line, (x, y))
+                y += size[1] + 1
+            self._cache(self._txt_cache, key, txt_surf)
 
         # otherwise, render normally
-        else:
-            txt_surf = self.render(txt, False, self._color)
+        elif txt_surf is None:
+            txt_surf = self.render_line(txt)[0]
+            self._cache(self._txt_cache, key, txt_surf)
 
         # blit surf to the location
         if ctrd:
@@ -44,4 +77,4 @@ class Font(pgfont):
 
     def recolor(self, new_color : tuple[float, float, float]) -> None:
         ''' changes the color rendered from this font class '''
-        self._color = new_color
\ No newline at end of file
+        self._color = new_color
@@ -46,7 +46,7 @@ class Glob:
     self.TILES_PER_CHUNK = 8
     self.CHUNK_SIZE = self.TILE_SIZE * self.TILES_PER_CHUNK
 
-    self.tilemap = TileMap(self.TILE_SIZE)
+    self.tilemap = TileMap(self.TILE_SIZE, self.TILES_PER_CHUNK)
     self.sheets = Sheets()
     font_size = 20
     self.window = Window(self, w_width, w_height, font_size)
@@ -81,6 +81,11 @@ class Glob:
   # called each frame to update global stuff
   def update(self) -> None:
 
+    # pick up sheets edited on disk
+    changed = self.sheets.poll()
+    if changed:
+      self.window.reload_sheets(changed)
+
     self.scroll_t[0] = round(self.scroll_t[0], 2)
     self.scroll_t[1] = round(self.scroll_t[1], 2)
 
@@ -198,8 +198,14 @@ class Input:
 
         elif event.key == K_a and ctrl:
           if self.selected_tiles:
-            for pos in self.glob.tilemap.tilify(self.selected_tiles):
-              self.glob.tilemap.auto_tile(pos, self.layer, True)
+            tilemap = self.glob.tilemap
+            cells = tilemap.tilify(self.selected_tiles)
+            tilemap.auto_tile_region(self.layer, cells)
+
+            # the selected records are snapshots, fetch the new variants
+            self.selected_tiles = [tile for tile in
+                                   (tilemap.get_tile(cell, self.layer)
+                                    for cell in cells) if tile]
             self.glob.window.generate_mask()
           else:
             self.auto_tiling = not self.auto_tiling
@@ -336,7 +342,7 @@ class Input:
           loc = (self.pen_pos[0] - asset_size[0] / 2,
                  self.pen_pos[1] - asset_size[1] / 2)
           self.glob.tilemap.add_off_grid(loc, 'decor', (sheet, row, col),
-                                         self.layer)
+                                         self.layer, asset_size)
           self.holding = False
 
       elif self.tool == 'erase':
@@ -347,12 +353,11 @@ class Input:
 
           self.last_pos = px, py
 
-        '''
         elif self.entity_type == 'decor':
 
-          sheet = self.glob.window.sel_sheet
-          del_decor = self.glob.chunks.remove_decor(px, py, _layer)
-        '''
+          # erases the decor under the pen for as long as it's held
+          self.glob.tilemap.remove_off_grid(pygame.Rect(px, py, 1, 1),
+                                            self.layer)
 
     # move the scroll target with the arrows
     for key in self.arrow_bools:
@@ -1,3 +1,5 @@
+import math
+import heapq
 import pygame
 
 # compare method for kdtrees
@@ -10,155 +12,342 @@ def compare(p1: tuple, p2: tuple, vert: bool) -> float:
 def sq_dist(p1: tuple, p2: tuple) -> float:
   return ((p1[0] - p2[0]) ** 2) + ((p1[1] - p2[1]) ** 2)
 
-# returns a modified version of input rect vased on p, cmp, and vert
-def resize_rect(r: pygame.Rect, p: tuple, cmp: float,
-                vert: bool) -> pygame.Rect:
-  x, y = p
-  if vert and cmp < 0:
-    r = pygame.Rect(r.x, r.y, x - r.x, r.h)
-  elif vert and cmp >= 0:
-    r = pygame.Rect(x, r.y, r.right - x, r.h)
-  elif not vert and cmp < 0:
-    r = pygame.Rect(r.x, r.y, r.w, y - r.y)
+# returns squared distance from a point to the box x0, y0, x1, y1
+def box_sq_dist(px: float, py: float, x0: float, y0: float, x1: float,
+                y1: float) -> float:
+  dx = x0 - px if px < x0 else px - x1 if px > x1 else 0
+  dy = y0 - py if py < y0 else py - y1 if py > y1 else 0
+  return dx * dx + dy * dy
+
+# pushes a node's children with their cell bounds onto a traversal stack,
+# the child on pos's side last so it's popped first
+def push_children(stack: list, x: object, vert: bool, x0: float, y0: float,
+                  x1: float, y1: float, pos: tuple) -> None:
+  nx, ny = x.pos
+  if vert:
+    low = (x.left, False, x0, y0, nx, y1)
+    high = (x.right, False, nx, y0, x1, y1)
+    near_low = pos[0] < nx
   else:
-    r = pygame.Rect(r.x, y, r.w, r.bottom - y)
-  r.normalize()
-  return r
-
-# method for finding distance from rect to a point
-def rect_sq_dist(r: pygame.Rect, p: tuple) -> float:
-  x, y = p
-  rect_x = x
-  rect_y = y
-  if x < r.left:
-    rect_x = r.left
-  elif x > r.right:
-    rect_x = r.right
-  if y < r.top:
-    rect_y = r.top
-  elif y > r.bottom:
-    rect_y = r.bottom
-
-  return ((x - rect_x) ** 2) + ((y - rect_y) ** 2)
+    low = (x.left, True, x0, y0, x1, ny)
+    high = (x.right, True, x0, ny, x1, y1)
+    near_low = pos[1] < ny
+  if near_low:
+    stack.append(high)
+    stack.append(low)
+  else:
+    stack.append(low)
+    stack.append(high)
 
+# kdtree that stays balanced, a subtree that gets too lopsided after an
+# insert is rebuilt around its medians (scapegoat style). alpha is how much
+# of a subtree one child may hold before that happens, 1 never rebuilds.
+# removed nodes are left in place as tombstones until more than max_dead of
+# the nodes are dead, then the live ones are rebuilt into a fresh tree
 class KDTree:
   class _Node:
+    __slots__ = ('pos', 'data', 'left', 'right', 'size', 'dead')
+
     def __init__(self, pos: tuple, data: type):
       self.pos = pos
       self.data = data
       self.left = None
       self.right = None
+      self.size = 1
+      self.dead = False
 
-  def __init__(self, item_size: int):
+  def __init__(self, item_size: int, alpha: float=0.7,
+               max_dead: float=0.5):
     self.root = None
     self.n = 0
+    self.dead = 0
+    self.alpha = alpha
+    self.max_dead = max_dead
     self._item_size = item_size
+
+    # nodes the last range or find_nearest call looked at
+    self.last_visited = 0
     self._test_rect = pygame.Rect(0, 0, item_size, item_size)
 
   def clear(self) -> None:
-    self.__init__()
+    self.__init__(self._item_size, self.alpha, self.max_dead)
+
+  # replaces the tree's contents with (pos, data) items, building it
+  # balanced in one go
+  def build(self, items: iter) -> None:
+    nodes = [self._Node(tuple(pos), data) for pos, data in items]
+    self.n = len(nodes)
+    self.dead = 0
+    self.root = self._build(nodes, True)
+
+  # rebuilds the tree from its live nodes, dropping the tombstones
+  def compact(self) -> None:
+    nodes = [x for x in self._nodes(self.root) if not x.dead]
+    self.dead = 0
+    self.root = self._build(nodes, True)
+
+  # builds a subtree from nodes, splitting each level at the median. a run
+  # of nodes equal to the median is split evenly too, so repeated positions
+  # can't make it lopsided, which is why get looks both ways on a tie
+  def _build(self, nodes: list, vert: bool) -> _Node:
+    if not nodes:
+      return None
+
+    axis = 0 if vert else 1
+    nodes.sort(key=lambda x: x.pos[axis])
+    m = len(nodes) // 2
+
+    x = nodes[m]
+    x.left = self._build(nodes[:m], not vert)
+    x.right = self._build(nodes[m + 1:], not vert)
+    x.size = len(nodes)
+    return x
 
   # inserts node into kdtree
   def put(self, pos: tuple, data: type) -> None:
-    self.root = self._put(self.root, pos, data, True)
+    node = self._Node(pos, data)
+    self.n += 1
+    if not self.root:
+      self.root = node
+      return
 
-  # recursive helper method for self.put
-  def _put(self, x: _Node, pos: tuple, data: type, vert: bool) -> _Node:
-    if not x:
-      self.n += 1
-      return self._Node(pos, data)
+    # walk down without recursion, keeping the path for rebalancing
+    path = []
+    x, vert = self.root, True
+    while True:
+      path.append(x)
+      x.size += 1
+      if compare(pos, x.pos, vert) < 0:
+        if not x.left:
+          x.left = node
+          break
+        x = x.left
+      else:
+        if not x.right:
+          x.right = node
+          break
+        x = x.right
+      vert = not vert
 
-    c = compare(pos, x.pos, vert)
-    if c < 0:
-      x.left = self._put(x.left, pos, data, not vert)
+    total = self.n + self.dead
+    if self.alpha < 1 and len(path) > math.log(total, 1 / self.alpha):
+      self._rebalance(path, node)
+
+  # rebuilds the lowest subtree on the path that one child outweighs
+  def _rebalance(self, path: list, node: _Node) -> None:
+    child = node
+    for depth in range(len(path) - 1, -1, -1):
+      x = path[depth]
+      if child.size > self.alpha * x.size:
+        break
+      child = x
     else:
-      x.right = self._put(x.right, pos, data, not vert)
-    return x
+      return
+
+    subtree = self._build(self._nodes(x), depth % 2 == 0)
+    if not depth:
+      self.root = subtree
+    elif path[depth - 1].left is x:
+      path[depth - 1].left = subtree
+    else:
+      path[depth - 1].right = subtree
+
+  # returns every node in a subtree
+  def _nodes(self, x: _Node) -> list:
+    nodes = []
+    stack = [x]
+    while stack:
+      x = stack.pop()
+      if x:
+        nodes.append(x)
+        stack.append(x.left)
+        stack.append(x.right)
+    return nodes
 
   # gets a node from the tree given a pos, returns none for invalid pos
   def get(self, pos: tuple) -> None:
-    return self._get(self.root, pos, True)
+    stack = [(self.root, True)]
+    while stack:
+      x, vert = stack.pop()
+      if not x:
+        continue
+      if x.pos == pos and not x.dead:
+        return x
+      side = compare(pos, x.pos, vert)
+      if side <= 0:
+        stack.append((x.left, not vert))
+      if side >= 0:
+        stack.append((x.right, not vert))
+    return None
 
-  # recursive helper method for self.get
-  def _get(self, x: _Node, pos: tuple, vert: bool) -> _Node:
+  # removes one item at pos and returns its data, or None if there isn't one
+  def remove(self, pos: tuple) -> type:
+    x = self.get(tuple(pos))
     if not x:
       return None
-    if x.pos == pos:
-      return x
+    self._kill(x)
+    self._maybe_compact()
+    return x.data
 
-    c = compare(pos, x.pos, vert)
-    if c < 0:
-      return self._get(x.left, pos, not vert)
-    else:
-      return self._get(x.right, pos, not vert)
+  # removes every item range would return for the query and returns their
+  # data
+  def remove_range(self, query: pygame.Rect) -> list:
+    nodes = self._range_nodes(query)
+    for x in nodes:
+      self._kill(x)
+    self._maybe_compact()
+    return [x.data for x in nodes]
+
+  # marks a node dead
+  def _kill(self, x: _Node) -> None:
+    x.dead = True
+    self.n -= 1
+    self.dead += 1
 
-  # returns nearest node to a given position
-  def find_nearest(self, pos: tuple, curr_rect: pygame.Rect) -> type:
+  # compacts once too much of the tree is dead
+  def _maybe_compact(self) -> None:
+    if self.dead > self.max_dead * (self.n + self.dead):
+      self.compact()
+
+  # returns nearest node to a given position, curr_rect optionally bounds
+  # the space the tree's points are in
+  def find_nearest(self, pos: tuple, curr_rect: pygame.Rect=None) -> type:
     if self.n == 0:
       return None
-    x = self._find_nearest(self.root, pos, self.root, curr_rect, True)
-    return x.pos
+    px, py = pos
 
-  # recursive helper method for self.find_nearest
-  def _find_nearest(self, x: _Node, pos: tuple, champ: _Node,
-                    curr_rect: pygame.Rect, vert: bool) -> _Node:
-    # x is empty node
-    if not x:
-      return champ
-
-    # prune this branch if its rect is further than the closest found point
-    if sq_dist(pos, champ.pos) < rect_sq_dist(curr_rect, pos):
-      return champ
-
-    # update champ if x is closer
-    if sq_dist(pos, x.pos) < sq_dist(pos, champ.pos):
-      champ = x
-
-    # decide which direction to go to check first
-    if (vert and pos[0] < x.pos[0]) or (not vert and pos[1] < x.pos[1]):
-      # left first
-      curr_rect = resize_rect(curr_rect, x.pos, -1, vert)
-      best_left = self._find_nearest(x.left, pos, champ, curr_rect, not vert)
-      if sq_dist(pos, best_left.pos) < sq_dist(pos, champ.pos):
-        champ = best_left
-      curr_rect = resize_rect(curr_rect, x.pos, 1, vert)
-      best_right = self._find_nearest(x.right, pos, champ, curr_rect, not vert)
-      if sq_dist(pos, best_right.pos) < sq_dist(pos, champ.pos):
-        champ = best_right
+    if curr_rect:
+      bounds = curr_rect.left, curr_rect.top, curr_rect.right, curr_rect.bottom
     else:
-      # right first
-      curr_rect = resize_rect(curr_rect, x.pos, 1, vert)
-      best_right = self._find_nearest(x.right, pos, champ, curr_rect, not vert)
-      if sq_dist(pos, best_right.pos) < sq_dist(pos, champ.pos):
-        champ = best_right
-      curr_rect = resize_rect(curr_rect, x.pos, -1, vert)
-      best_left = self._find_nearest(x.left, pos, champ, curr_rect, not vert)
-      if sq_dist(pos, best_left.pos) < sq_dist(pos, champ.pos):
-        champ = best_left
-
-    return champ
+      bounds = -math.inf, -math.inf, math.inf, math.inf
 
-  def range(self, query: pygame.Rect) -> list:
+    champ = None
+    best = math.inf
+    visited = 0
+
+    # each entry is a node, the split it uses and its cell's bounds
+    stack = [(self.root, True, *bounds)]
+    while stack:
+      x, vert, x0, y0, x1, y1 = stack.pop()
+
+      # prune this branch if its cell is further than the closest point
+      if not x or best < box_sq_dist(px, py, x0, y0, x1, y1):
+        continue
+      visited += 1
+
+      d = sq_dist(pos, x.pos)
+      if d < best and not x.dead:
+        champ, best = x, d
+      push_children(stack, x, vert, x0, y0, x1, y1, pos)
+
+    self.last_visited = visited
+    return champ.pos
+
+  # returns the data of the k items closest to pos, closest first
+  def k_nearest(self, pos: tuple, k: int) -> list:
+    if k <= 0 or self.n == 0:
+      return []
+    px, py = pos
+
+    # max heap of the best k so far as (-distance, order, node), the order
+    # breaks distance ties without comparing nodes
+    heap = []
+    order = 0
+    visited = 0
+
+    stack = [(self.root, True, -math.inf, -math.inf, math.inf, math.inf)]
+    while stack:
+      x, vert, x0, y0, x1, y1 = stack.pop()
+      if not x:
+        continue
+      if len(heap) == k and -heap[0][0] < box_sq_dist(px, py, x0, y0, x1, y1):
+        continue
+      visited += 1
+
+      if not x.dead:
+        d = sq_dist(pos, x.pos)
+        if len(heap) < k:
+          heapq.heappush(heap, (-d, order, x))
+        elif d < -heap[0][0]:
+          heapq.heapreplace(heap, (-d, order, x))
+        order += 1
+      push_children(stack, x, vert, x0, y0, x1, y1, pos)
+
+    self.last_visited = visited
+    heap.sort(key=lambda item: (-item[0], item[1]))
+    return [x.data for _, _, x in heap]
+
+  # returns the data of every item within r of pos, in no particular order
+  def within_radius(self, pos: tuple, r: float) -> list:
     found = []
-    self._range(self.root, query, query, found, True)
+    if self.n == 0 or r < 0:
+      return found
+    px, py = pos
+    r2 = r * r
+    visited = 0
+
+    stack = [(self.root, True, -math.inf, -math.inf, math.inf, math.inf)]
+    while stack:
+      x, vert, x0, y0, x1, y1 = stack.pop()
+      if not x or r2 < box_sq_dist(px, py, x0, y0, x1, y1):
+        continue
+      visited += 1
+
+      if not x.dead and sq_dist(pos, x.pos) <= r2:
+        found.append(x.data)
+      push_children(stack, x, vert, x0, y0, x1, y1, pos)
+
+    self.last_visited = visited
     return found
 
-  def _range(self, x: _Node, query: pygame.Rect, curr_rect: pygame.Rect,
-             found: list, vert: bool) -> None:
-    if not x:
-      return
-    if not query.colliderect(curr_rect):
-      return
-    self._test_rect.center = x.pos
-    if query.colliderect(self._test_rect):
-      found.append(x.data)
-    self._range(x.left, query, resize_rect(curr_rect, x.pos, -1, vert),
-                found, not vert)
-    self._range(x.right, query, resize_rect(curr_rect, x.pos, 1, vert),
-                found, not vert)
+  # returns the data of every item whose item sized rect touches the query
+  def range(self, query: pygame.Rect) -> list:
+    return [x.data for x in self._range_nodes(query)]
+
+  # returns the live nodes whose item sized rect touches the query
+  def _range_nodes(self, query: pygame.Rect) -> list:
+    found = []
+    if not self.root:
+      return found
+
+    # cells are pruned against the query grown by half an item, so items
+    # centered just outside it are still tested
+    test_rect = self._test_rect
+    pad = self._item_size / 2 + 1
+    qx0, qy0 = query.left - pad, query.top - pad
+    qx1, qy1 = query.right + pad, query.bottom + pad
+    visited = 0
+
+    stack = [(self.root, True, -math.inf, -math.inf, math.inf, math.inf)]
+    while stack:
+      x, vert, x0, y0, x1, y1 = stack.pop()
+      if x1 < qx0 or qx1 < x0 or y1 < qy0 or qy1 < y0:
+        continue
+      visited += 1
+
+      test_rect.center = x.pos
+      if not x.dead and query.colliderect(test_rect):
+        found.append(x)
+
+      nx, ny = x.pos
+      if vert:
+        if x.left:
+          stack.append((x.left, False, x0, y0, nx, y1))
+        if x.right:
+          stack.append((x.right, False, nx, y0, x1, y1))
+      else:
+        if x.left:
+          stack.append((x.left, True, x0, y0, x1, ny))
+        if x.right:
+          stack.append((x.right, True, x0, ny, x1, y1))
+
+    self.last_visited = visited
+    return found
 
   # returns the kdtree as a dictionary
   def convert_to_dict(self) -> dict:
+    if self.dead:
+      self.compact()
     if not self.root:
       return {}
 
@@ -0,0 +1,45 @@
+import time
+
+from pygame import Surface
+
+INDENT = '    '
+
+class InfoPanel:
+  # init, fps_rate is the seconds between refreshes of the fps field
+  def __init__(self, font: object, fields: list[str], width: int,
+               fps_rate: float=0.25):
+    self.font = font
+    self.fields = fields
+    self.fps_rate = fps_rate
+    self.last_fps = 0
+
+    # each field gets its own line, with a blank line above and below
+    self.line_h = font.size('')[1] + 1
+    self.height = self.line_h * (len(fields) + 2)
+    self.surf = Surface((width, self.height))
+    self.surf.set_colorkey((0, 0, 0))
+
+    self.values = {field: None for field in fields}
+    self.rows = {field: i + 1 for i, field in enumerate(fields)}
+
+  # redraws the fields whose values changed, the fps field only refreshes
+  # every fps_rate seconds
+  def update(self, values: dict) -> Surface:
+    now = time.time()
+    fps_due = now - self.last_fps >= self.fps_rate
+
+    for field, value in values.items():
+      if value == self.values[field]:
+        continue
+      if field == 'fps' and not fps_due:
+        continue
+      if field == 'fps':
+        self.last_fps = now
+
+      self.values[field] = value
+      y = self.rows[field] * self.line_h
+      self.surf.fill((0, 0, 0), (0, y, self.surf.get_width(), self.line_h))
+      line, _ = self.font.render_line(f'{INDENT}{field} : {value}')
+      self.surf.blit(line, (0, y))
+
+    return self.surf
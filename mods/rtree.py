@@ -0,0 +1,311 @@
+import math
+import heapq
+import pygame
+
+from mods.kd import box_sq_dist
+
+# returns the box of a leaf entry or a node as (x0, y0, x1, y1, ...)
+def box_of(item: object) -> tuple:
+  return item.box if isinstance(item, RTree._Node) else item
+
+# returns the box covering a list of leaf entries, nodes or boxes
+def cover(items: list) -> tuple:
+  boxes = [box_of(item) for item in items]
+  return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+          max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+# returns how much a box's area grows to also cover another box
+def enlargement(box: tuple, other: tuple) -> float:
+  x0, y0 = min(box[0], other[0]), min(box[1], other[1])
+  x1, y1 = max(box[2], other[2]), max(box[3], other[3])
+  return (x1 - x0) * (y1 - y0) - (box[2] - box[0]) * (box[3] - box[1])
+
+# sort keys by box center along the x or y axis
+def center_x(item: object) -> float:
+  box = box_of(item)
+  return box[0] + box[2]
+
+def center_y(item: object) -> float:
+  box = box_of(item)
+  return box[1] + box[3]
+
+# r-tree of items with their own bounding boxes. it can be bulk loaded with
+# sort tile recursive packing and also takes items one at a time. leaf
+# entries are (x0, y0, x1, y1, data) tuples
+class RTree:
+  class _Node:
+    __slots__ = ('box', 'children', 'leaf')
+
+    def __init__(self, children: list, leaf: bool):
+      self.children = children
+      self.leaf = leaf
+      self.box = cover(children)
+
+  def __init__(self, max_entries: int=16):
+    self.root = None
+    self.n = 0
+    self.max_entries = max_entries
+
+  def clear(self) -> None:
+    self.__init__(self.max_entries)
+
+  # replaces the tree's contents with (box, data) items, packing them into
+  # full nodes a level at a time
+  def build(self, items: iter) -> None:
+    entries = [(*box, data) for box, data in items]
+    self.n = len(entries)
+    self.root = None
+    if not entries:
+      return
+
+    nodes = self._pack(entries, True)
+    while len(nodes) > 1:
+      nodes = self._pack(nodes, False)
+    self.root = nodes[0]
+
+  # groups entries or nodes into parents, sorted into vertical slices by x
+  # and then runs of max_entries by y within each slice
+  def _pack(self, items: list, leaf: bool) -> list:
+    m = self.max_entries
+    slices = math.ceil(math.sqrt(math.ceil(len(items) / m)))
+    slice_len = slices * m
+
+    items.sort(key=center_x)
+    nodes = []
+    for i in range(0, len(items), slice_len):
+      part = sorted(items[i:i + slice_len], key=center_y)
+      for j in range(0, len(part), m):
+        nodes.append(self._Node(part[j:j + m], leaf))
+    return nodes
+
+  # adds an item with its top left at pos and the given size
+  def put(self, pos: tuple, data: type, size: tuple) -> None:
+    x, y = pos
+    self.insert((x, y, x + size[0], y + size[1]), data)
+
+  # adds an item with the box x0, y0, x1, y1
+  def insert(self, box: tuple, data: type) -> None:
+    entry = (*box, data)
+    self.n += 1
+    if not self.root:
+      self.root = self._Node([entry], True)
+      return
+
+    # go down the child that grows least, growing boxes on the way
+    path = []
+    node = self.root
+    while True:
+      path.append(node)
+      node.box = cover((node.box, entry))
+      if node.leaf:
+        break
+      node = min(node.children,
+                 key=lambda c: (enlargement(c.box, entry),
+                                (c.box[2] - c.box[0]) * (c.box[3] - c.box[1])))
+    node.children.append(entry)
+
+    # split overfull nodes back up the path
+    for depth in range(len(path) - 1, -1, -1):
+      node = path[depth]
+      if len(node.children) <= self.max_entries:
+        break
+      other = self._split(node)
+      if depth:
+        path[depth - 1].children.append(other)
+      else:
+        self.root = self._Node([node, other], False)
+
+  # moves the half of a node's children along its longer side into a new
+  # sibling and returns it
+  def _split(self, node: _Node) -> _Node:
+    box = node.box
+    key = center_x if box[2] - box[0] >= box[3] - box[1] else center_y
+    children = sorted(node.children, key=key)
+    half = len(children) // 2
+    node.children = children[:half]
+    node.box = cover(node.children)
+    return self._Node(children[half:], node.leaf)
+
+  # returns the data of every item whose box overlaps the query
+  def range(self, query: pygame.Rect) -> list:
+    return [entry[4] for entry in self._range_entries(query)]
+
+  # returns the leaf entries whose box overlaps the query
+  def _range_entries(self, query: pygame.Rect) -> list:
+    found = []
+    if not self.root or not query.w or not query.h:
+      return found
+    qx0, qy0, qx1, qy1 = query.left, query.top, query.right, query.bottom
+
+    stack = [self.root]
+    while stack:
+      node = stack.pop()
+      if node.leaf:
+        for entry in node.children:
+          if entry[0] < qx1 and qx0 < entry[2] and entry[1] < qy1 and \
+              qy0 < entry[3]:
+            found.append(entry)
+        continue
+      for child in node.children:
+        box = child.box
+        if box[0] < qx1 and qx0 < box[2] and box[1] < qy1 and qy0 < box[3]:
+          stack.append(child)
+    return found
+
+  # removes every item range would return for the query and returns their
+  # data
+  def remove_range(self, query: pygame.Rect) -> list:
+    if not self.root:
+      return []
+    removed = []
+    self._remove(self.root, query, removed)
+    self.n -= len(removed)
+    if not self.root.children:
+      self.root = None
+    elif not self.root.leaf and len(self.root.children) == 1:
+      self.root = self.root.children[0]
+    return removed
+
+  # removes overlapping entries under a node, dropping nodes left empty
+  # and shrinking boxes on the way back up
+  def _remove(self, node: _Node, query: pygame.Rect, removed: list) -> None:
+    qx0, qy0, qx1, qy1 = query.left, query.top, query.right, query.bottom
+    if not query.w or not query.h:
+      return
+
+    if node.leaf:
+      kept = []
+      for entry in node.children:
+        if entry[0] < qx1 and qx0 < entry[2] and entry[1] < qy1 and \
+            qy0 < entry[3]:
+          removed.append(entry[4])
+        else:
+          kept.append(entry)
+      if len(kept) == len(node.children):
+        return
+      node.children = kept
+
+    else:
+      count = len(removed)
+      for child in node.children:
+        box = child.box
+        if box[0] < qx1 and qx0 < box[2] and box[1] < qy1 and qy0 < box[3]:
+          self._remove(child, query, removed)
+      if len(removed) == count:
+        return
+      node.children = [c for c in node.children if c.children]
+
+    if node.children:
+      node.box = cover(node.children)
+
+  # removes one item whose box contains pos and returns its data, or None
+  # if there isn't one
+  def remove(self, pos: tuple) -> type:
+    x, y = pos
+    entry = next((e for e in self._range_entries(pygame.Rect(x, y, 1, 1))
+                  if e[0] <= x < e[2] and e[1] <= y < e[3]), None)
+    if entry is None:
+      return None
+
+    # walk down to the leaf holding it, keeping the path to refit
+    path = []
+    stack = [(self.root, 0)]
+    while stack:
+      node, depth = stack.pop()
+      del path[depth:]
+      path.append(node)
+      if node.leaf:
+        if any(e is entry for e in node.children):
+          break
+        continue
+      for child in node.children:
+        box = child.box
+        if box[0] <= entry[0] and entry[2] <= box[2] and \
+            box[1] <= entry[1] and entry[3] <= box[3]:
+          stack.append((child, depth + 1))
+
+    path[-1].children = [e for e in path[-1].children if e is not entry]
+    for depth in range(len(path) - 1, 0, -1):
+      if not path[depth].children:
+        parent = path[depth - 1]
+        parent.children = [c for c in parent.children if c is not path[depth]]
+    for node in reversed(path):
+      if node.children:
+        node.box = cover(node.children)
+
+    self.n -= 1
+    if not self.root.children:
+      self.root = None
+    elif not self.root.leaf and len(self.root.children) == 1:
+      self.root = self.root.children[0]
+    return entry[4]
+
+  # returns the data of the k items whose boxes are closest to pos, closest
+  # first. nodes and items come off one heap ordered by box distance, so an
+  # item popped is never beaten by anything still queued
+  def k_nearest(self, pos: tuple, k: int) -> list:
+    found = []
+    if k <= 0 or not self.root:
+      return found
+    px, py = pos
+
+    order = 0
+    heap = [(0, order, self.root)]
+    while heap and len(found) < k:
+      _, _, item = heapq.heappop(heap)
+      if not isinstance(item, RTree._Node):
+        found.append(item[4])
+        continue
+      for child in item.children:
+        box = box_of(child)
+        order += 1
+        heapq.heappush(heap, (box_sq_dist(px, py, *box[:4]), order, child))
+    return found
+
+  # returns the data of every item whose box is within r of pos, in no
+  # particular order
+  def within_radius(self, pos: tuple, r: float) -> list:
+    found = []
+    if not self.root or r < 0:
+      return found
+    px, py = pos
+    r2 = r * r
+
+    stack = [self.root]
+    while stack:
+      node = stack.pop()
+      if node.leaf:
+        for entry in node.children:
+          if box_sq_dist(px, py, *entry[:4]) <= r2:
+            found.append(entry[4])
+        continue
+      for child in node.children:
+        if box_sq_dist(px, py, *child.box) <= r2:
+          stack.append(child)
+    return found
+
+  # returns the number of items
+  def __len__(self) -> int:
+    return self.n
+
+  # yields every item's (box, data), the shape build takes
+  def items(self) -> iter:
+    stack = [self.root] if self.root else []
+    while stack:
+      node = stack.pop()
+      if node.leaf:
+        for entry in node.children:
+          yield entry[:4], entry[4]
+      else:
+        stack.extend(node.children)
+
+  # yields every item's data
+  def __iter__(self) -> iter:
+    stack = [self.root] if self.root else []
+    while stack:
+      node = stack.pop()
+      if node.leaf:
+        for entry in node.children:
+          yield entry[4]
+      else:
+        stack.extend(node.children)
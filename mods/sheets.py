@@ -1,74 +1,540 @@
 import pygame, os
 import json
+import hashlib
+import time
+import warnings
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from pygame import Surface
 
+from mods.assets import palette
+
+try:
+  import numpy
+  from pygame import surfarray
+except ImportError:
+  numpy = None
+
 TRANSPARENT_COLOR = 0, 0, 0
+START_COLOR = 255, 41, 250
+END_COLOR = 0, 255, 255
+CACHE_EXT = '.cache'
+ATLAS_SIZE = 1024
+
+# returns boolean [x][y] arrays marking the start and end marker pixels
+def _find_markers(sheet_surf: Surface) -> tuple:
+  start = *START_COLOR, 255
+  end = *END_COLOR, 255
+
+  # palette surfaces map colors to the nearest index, so compare real colors
+  if sheet_surf.get_bytesize() == 1:
+    pixels = surfarray.array3d(sheet_surf)
+    starts = (pixels == START_COLOR).all(axis=2)
+    ends = (pixels == END_COLOR).all(axis=2)
+    if sheet_surf.get_flags() & pygame.SRCALPHA:
+      opaque = surfarray.array_alpha(sheet_surf) == 255
+      starts &= opaque
+      ends &= opaque
+    return starts, ends
+
+  pixels = surfarray.array2d(sheet_surf)
+  return (pixels == sheet_surf.map_rgb(start),
+          pixels == sheet_surf.map_rgb(end))
+
+# returns the rect of every asset in a sheet using a bulk pixel array, rects
+# are grouped into rows the same way the markers are laid out in the sheet
+def find_rects(sheet_surf: Surface) -> list[list[tuple]]:
+  if numpy is None:
+    return find_rects_scan(sheet_surf)
+
+  width, height = sheet_surf.get_size()
+  starts, ends = _find_markers(sheet_surf)
+
+  # start markers only count on rows flagged in the first column
+  starts[:, ~starts[0]] = False
+  sx, sy = numpy.nonzero(starts)
+  order = numpy.lexsort((sx, sy))
+  sx, sy = sx[order], sy[order]
+  if not len(sx):
+    return []
+
+  ex, ey = numpy.nonzero(ends)
+
+  # first end marker right of each start marker on the same row
+  row_keys = numpy.sort(ey * width + ex)
+  k = numpy.searchsorted(row_keys, sy * width + sx, side='right')
+  hit = row_keys[numpy.minimum(k, len(row_keys) - 1)] if len(row_keys) \
+    else numpy.zeros_like(sx)
+  found = (k < len(row_keys)) & (hit // width == sy)
+  x = numpy.where(found, hit % width, width - 1)
+  w = numpy.where(found, x - sx - 1, 0)
+
+  # first end marker below the start row in that end marker's column
+  col_keys = numpy.sort(ex * height + ey)
+  k = numpy.searchsorted(col_keys, x * height + sy, side='right')
+  hit = col_keys[numpy.minimum(k, len(col_keys) - 1)] if len(col_keys) \
+    else numpy.zeros_like(sx)
+  found = (k < len(col_keys)) & (hit // height == x)
+  h = numpy.where(found, hit % height - sy - 1, 0)
+
+  # split the flat marker list back into rows
+  rects = []
+  bounds = numpy.flatnonzero(numpy.diff(sy)) + 1
+  flat = list(zip((sx + 1).tolist(), (sy + 1).tolist(), w.tolist(),
+                  h.tolist()))
+  for a, b in zip([0, *bounds.tolist()], [*bounds.tolist(), len(flat)]):
+    rects.append(flat[a:b])
+
+  return rects
+
+# pixel by pixel version of find_rects, used when numpy is missing
+def find_rects_scan(sheet_surf: Surface) -> list[list[tuple]]:
+  start = *START_COLOR, 255
+  end = *END_COLOR, 255
+  width, height = sheet_surf.get_size()
+
+  rects = []
+  for i in range(height):
+    if sheet_surf.get_at((0, i)) == start:
+      row = []
+      for j in range(width):
+        if sheet_surf.get_at((j, i)) == start:
+
+          w, h = 0, 0
+          for x in range(j + 1, width):
+            if sheet_surf.get_at((x, i)) == end:
+              w = x - j - 1
+              break
+
+          for y in range(i + 1, height):
+            if sheet_surf.get_at((x, y)) == end:
+              h = y - i - 1
+              break
+
+          row.append((j + 1, i + 1, w, h))
+      rects.append(row)
+
+  return rects
+
+# cuts the assets out of a sheet given the rects from find_rects
+def slice_sheet(sheet_surf: Surface, rects: list[list[tuple]]) -> list:
+  textures = []
+  for row in rects:
+    surfs = []
+    for x, y, w, h in row:
+      surf = Surface((w, h))
+      surf.set_colorkey(TRANSPARENT_COLOR)
+      surf.blit(sheet_surf, (0, 0), (x, y, w, h))
+      surfs.append(surf)
+    textures.append(surfs)
+  return textures
+
+# returns the stat key used to tell if a file changed since it was cached
+def _file_key(path: str) -> list:
+  stat = os.stat(path)
+  return [stat.st_size, stat.st_mtime_ns]
+
+# returns the hash of a file's contents
+def _file_hash(path: str) -> str:
+  with open(path, 'rb') as file_data:
+    return hashlib.sha1(file_data.read()).hexdigest()
+
+# reads the slice cache next to a sheet, returns an empty dict if unusable
+def _read_cache(path: str) -> dict:
+  try:
+    with open(path) as file_data:
+      cache = json.load(file_data)
+  except (OSError, ValueError):
+    return {}
+  return cache if isinstance(cache, dict) else {}
+
+# writes the slice cache next to a sheet, a read only input dir just means
+# the sheet gets sliced again next launch
+def _write_cache(path: str, cache: dict) -> None:
+  try:
+    with open(path, 'w') as file_data:
+      json.dump(cache, file_data)
+  except OSError:
+    pass
+
+# loads a sheet surface with its asset rects and config, the rects and config
+# come from the slice cache when the png and json haven't changed
+def load_sheet(path: str, name: str) -> tuple[Surface, list, list]:
+  png_path = os.path.join(path, name + '.png')
+  json_path = os.path.join(path, name + '.json')
+  cache_path = os.path.join(path, name + CACHE_EXT)
+
+  cache = _read_cache(cache_path)
+  dirty = False
+
+  sheet_surf = pygame.image.load(png_path)
+  sheet_surf.set_colorkey(TRANSPARENT_COLOR)
+
+  # a touched but unchanged png only costs a hash, not a marker scan
+  png_key = _file_key(png_path)
+  if cache.get('png_key') != png_key:
+    png_hash = _file_hash(png_path)
+    if cache.get('png_hash') != png_hash or 'rects' not in cache:
+      cache['rects'] = find_rects(sheet_surf)
+      cache['png_hash'] = png_hash
+    cache['png_key'] = png_key
+    dirty = True
+
+  # configs are small, so any change just reparses the json
+  json_key = _file_key(json_path) if os.path.exists(json_path) else None
+  if cache.get('json_key') != json_key or 'config' not in cache:
+    config = None
+    if json_key:
+      with open(json_path) as file_data:
+        config = json.load(file_data)
+    cache['config'] = config
+    cache['json_key'] = json_key
+    dirty = True
+
+  if dirty:
+    _write_cache(cache_path, cache)
+
+  return sheet_surf, cache['rects'], cache['config']
+
+# loads and slices a sheet in a worker process, the assets come back as one
+# packed rgb buffer since surfaces can't be sent between processes
+def _slice_worker(path: str, name: str) -> tuple:
+  sheet_surf, rects, config = load_sheet(path, name)
+  pixels = []
+  for row in slice_sheet(sheet_surf, rects):
+    for surf in row:
+      pixels.append(pygame.image.tostring(surf, 'RGB'))
+  return name, rects, config, b''.join(pixels)
+
+# rebuilds the sliced textures of a sheet from a worker's packed buffer
+def _unpack_sheet(rects: list, pixels: bytes) -> list:
+  view = memoryview(pixels)
+  offset = 0
+  textures = []
+  for row in rects:
+    surfs = []
+    for _, _, w, h in row:
+      size = w * h * 3
+      surf = pygame.image.fromstring(view[offset:offset + size].tobytes(),
+                                     (w, h), 'RGB')
+      surf.set_colorkey(TRANSPARENT_COLOR)
+      surfs.append(surf)
+      offset += size
+    textures.append(surfs)
+  return textures
+
+# packs sliced textures into as few atlas pages as possible using shelves,
+# returns the page sizes and the (page index, rect) of every texture
+def pack_atlas(textures: list, size: int=ATLAS_SIZE) -> tuple[list, list]:
+  areas = [[None] * len(row) for row in textures]
+  order = [(i, j) for i, row in enumerate(textures) for j in range(len(row))]
+  order.sort(key=lambda ij: -textures[ij[0]][ij[1]].get_height())
+
+  pages = []
+  x = y = shelf_h = 0
+  for i, j in order:
+    w, h = textures[i][j].get_size()
+
+    # start a new shelf, then a new page, when the texture doesn't fit
+    if pages and x + w > pages[-1][0]:
+      x, y, shelf_h = 0, y + shelf_h, 0
+    if not pages or y + h > pages[-1][1]:
+      pages.append([max(size, w), max(size, h)])
+      x = y = shelf_h = 0
+
+    areas[i][j] = len(pages) - 1, pygame.Rect(x, y, w, h)
+    x += w
+    shelf_h = max(shelf_h, h)
+
+  # trim each page down to the area actually used
+  used = [[0, 0] for _ in pages]
+  for row in areas:
+    for page, rect in row:
+      used[page][0] = max(used[page][0], rect.right)
+      used[page][1] = max(used[page][1], rect.bottom)
+  return used, areas
+
+# builds the atlas pages for a sheet, returning the (page, rect) of every
+# texture along with textures that are subsurfaces of the pages
+def build_atlas(textures: list) -> tuple[list, list]:
+  sizes, areas = pack_atlas(textures)
+  pages = [Surface(size) for size in sizes]
+  for i, row in enumerate(areas):
+    for j, (page, rect) in enumerate(row):
+      pages[page].blit(textures[i][j], rect)
+
+  # match the display format so blits skip the pixel conversion, pages stay
+  # off rle since area blits from an rle surface decode from the page top
+  if pygame.display.get_surface():
+    pages = [page.convert() for page in pages]
+  for page in pages:
+    page.set_colorkey(TRANSPARENT_COLOR)
+
+  handles = [[(pages[page], rect) for page, rect in row] for row in areas]
+  subsurfs = [[surf.subsurface(rect) for surf, rect in row] for row in handles]
+  return handles, subsurfs
+
+# writes a sheet config's offsets into the palette, if the sliced row lengths
+# are given the config's shape is checked against them, returns a list of
+# every mismatch found
+def compile_config(sheet: str, config: list, grid: list=None) -> list[str]:
+  for asset_id in palette.sheet_ids(sheet):
+    palette.offsets[asset_id] = 0, 0
+  if config is None:
+    return []
+
+  errors = []
+  if not isinstance(config, list):
+    return [f'{sheet}: config should be a list of rows']
+  if grid is not None and len(config) != len(grid):
+    errors.append(f'{sheet}: config has {len(config)} rows, '
+                  f'sheet has {len(grid)}')
+
+  for row, cols in enumerate(config):
+    if not isinstance(cols, list):
+      errors.append(f'{sheet}: row {row} should be a list of offsets')
+      continue
+    if grid is not None and row < len(grid) and len(cols) != grid[row]:
+      errors.append(f'{sheet}: row {row} has {len(cols)} offsets, '
+                    f'sheet has {grid[row]} assets')
+
+    for col, offset in enumerate(cols):
+      if not (isinstance(offset, list) and len(offset) == 2 and
+              all(isinstance(v, (int, float)) for v in offset)):
+        errors.append(f'{sheet}: offset at {row}, {col} should be [x, y]')
+        continue
+      palette.offsets[palette.intern((sheet, row, col))] = tuple(offset)
+
+  return errors
+
+# returns whether a sliced grid has a row and col
+def in_grid(grid: list, row: int, col: int) -> bool:
+  return 0 <= row < len(grid) and 0 <= col < len(grid[row])
+
+# returns the number of bytes of pixel data held by a sliced sheet
+def sheet_size(textures: list) -> int:
+  size = 0
+  for row in textures:
+    for surf in row:
+      size += surf.get_width() * surf.get_height() * surf.get_bytesize()
+  return size
 
 class Sheets:
-  # init
-  def __init__(self):
+  # init, max_bytes optionally caps the pixel memory held by loaded sheets
+  # and workers > 0 preloads every sheet in that many processes, in atlas
+  # mode each sheet is packed into a few pages blitted with an area rect
+  def __init__(self, path: str='input/', max_bytes: int=None,
+               workers: int=0, atlas: bool=False):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.atlas = atlas
 
-    # store all sheets in a dict
-    self.sheets = {
+    # loaded sheets, ordered from least to most recently used
+    self.sheets = OrderedDict()
+    self.sheet_bytes = {}
 
-    }
+    # (atlas page, rect) of every texture in loaded sheets for atlas mode
+    self.areas = {}
 
     self.sheet_configs = {
 
     }
 
-    # grab all .png files in the input dir
-    sheet_files = [f[:-4] for f in os.listdir('input/') if f.endswith('.png')]
-    config_files = [f[:-5] for f in os.listdir('input/') if f.endswith('.json')]
-
-    # grab each texture from each sheet and store the coords in a dict
-    for f in sheet_files:
-      sheet_surf = pygame.image.load(f'input/{f}.png')
-      sheet_surf.set_colorkey(TRANSPARENT_COLOR)
-      textures = []
-
-      # find each asset
-      for i in range(sheet_surf.get_height()):
-        if sheet_surf.get_at((0, i)) == (255, 41, 250, 255):
-          row = []
-          for j in range(sheet_surf.get_width()):
-            if sheet_surf.get_at((j, i)) == (255, 41, 250, 255):
-
-              w, h = 0, 0
-              for x in range(j + 1, sheet_surf.get_width()):
-                if sheet_surf.get_at((x, i)) == (0, 255, 255, 255):
-                  w = x - j - 1
-                  break
-
-              for y in range(i + 1, sheet_surf.get_height()):
-                if sheet_surf.get_at((x, y)) == (0, 255, 255, 255):
-                  h = y - i - 1
-                  break
-
-              surf = Surface((w, h))
-              surf.set_colorkey(TRANSPARENT_COLOR)
-              surf.blit(sheet_surf, (0, 0), (j + 1, i + 1, w, h))
-              row.append(surf)
-          textures.append(row)
-
-        self.sheets[f] = textures
-
-      # try to find configuration files
-      if f in config_files:
-        with open(f'input/{f}.json') as file_data:
-          self.sheet_configs[f] = json.load(file_data)
+    # config shape mismatches found when each sheet was sliced
+    self.config_errors = {}
+
+    # drawn in place of assets a sheet doesn't have (anymore)
+    self.missing = Surface((0, 0))
+
+    # only index the sheets here, textures are sliced on first use
+    self.file_keys = self._scan()
+    self.names = sorted(self.file_keys)
+    for f in self.names:
+      self._set_config(f, self._read_config(f))
+
+    # seconds between checks of the input dir for edited sheets
+    self.poll_rate = 1
+    self.last_poll = time.time()
+
+    if workers > 0:
+      self.preload(workers=workers)
 
   # returns a lsit of all stored sheets
   @property
   def sheet_names(self) -> list[str]:
-    return [sheet for sheet in self.sheets]
+    return self.names
+
+  # returns the png and json stat keys of every sheet in the input dir
+  def _scan(self) -> dict:
+    file_keys = {}
+    for f in os.listdir(self.path):
+      if f.endswith('.png'):
+        config_path = os.path.join(self.path, f[:-4] + '.json')
+        config_key = _file_key(config_path) \
+          if os.path.exists(config_path) else None
+        file_keys[f[:-4]] = _file_key(os.path.join(self.path, f)), config_key
+    return file_keys
+
+  # returns a sheet's json config, or None if it has none
+  def _read_config(self, sheet: str) -> list:
+    config_path = os.path.join(self.path, sheet + '.json')
+    if not os.path.exists(config_path):
+      return None
+    with open(config_path) as file_data:
+      return json.load(file_data)
+
+  # stores a sheet's config and writes its offsets into the palette
+  def _set_config(self, sheet: str, config: list) -> None:
+    self.sheet_configs.pop(sheet, None)
+    if config is not None:
+      self.sheet_configs[sheet] = config
+    compile_config(sheet, config)
+
+  # checks the input dir for edited sheets at most every poll_rate seconds,
+  # reslices loaded sheets whose png or json changed and returns the names
+  # of every added, removed or changed sheet
+  def poll(self) -> list[str]:
+    now = time.time()
+    if now - self.last_poll < self.poll_rate:
+      return []
+    self.last_poll = now
+
+    try:
+      file_keys = self._scan()
+    except OSError:
+      return []
+    changed = sorted(f for f in set(file_keys) | set(self.file_keys)
+                     if file_keys.get(f) != self.file_keys.get(f))
+    self.file_keys = file_keys
+    self.names = sorted(file_keys)
 
-  # returns surface given a sheet name with a row and col value
+    for f in changed:
+      self.reload(f)
+    return changed
+
+  # reads a sheet's textures and config again, the old ones are only
+  # replaced once the new ones loaded, a sheet that fails to load (likely
+  # mid save) keeps its last good copy and is retried on the next poll
+  def reload(self, sheet: str) -> None:
+    loaded = sheet in self.sheets
+    if sheet in self.file_keys:
+      try:
+        if loaded:
+          sheet_surf, rects, config = load_sheet(self.path, sheet)
+          textures = slice_sheet(sheet_surf, rects)
+        else:
+          config = self._read_config(sheet)
+      except (pygame.error, OSError, ValueError):
+        self.file_keys[sheet] = None
+        return
+    else:
+      config, loaded = None, False
+
+    self.unload(sheet)
+    self.config_errors.pop(sheet, None)
+    self._set_config(sheet, config)
+    if loaded:
+      self._store(sheet, textures, config)
+
+  # returns the sliced textures of a sheet, loading it if needed, a sheet
+  # that is gone or fails to load has none until a poll picks it up again
+  def get_sheet(self, sheet: str) -> list:
+    if sheet in self.sheets:
+      self.sheets.move_to_end(sheet)
+      return self.sheets[sheet]
+    if self.file_keys.get(sheet) is None:
+      return []
+
+    try:
+      return self.load(sheet)
+    except (pygame.error, OSError, ValueError):
+      self.file_keys[sheet] = None
+      return []
+
+  # slices the given sheets (all by default) in a pool of worker processes
+  def preload(self, names: list=None, workers: int=None) -> None:
+    names = [n for n in (names or self.names) if n not in self.sheets]
+    if not names:
+      return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      jobs = [pool.submit(_slice_worker, self.path, n) for n in names]
+      for job in jobs:
+        name, rects, config, pixels = job.result()
+        self._store(name, _unpack_sheet(rects, pixels), config)
+
+  # slices a sheet and unloads old sheets if over the memory budget
+  def load(self, sheet: str) -> list:
+    sheet_surf, rects, config = load_sheet(self.path, sheet)
+    return self._store(sheet, slice_sheet(sheet_surf, rects), config)
+
+  # stores a newly sliced sheet as the most recently used one
+  def _store(self, sheet: str, textures: list, config: list) -> list:
+    if self.atlas:
+      self.areas[sheet], textures = build_atlas(textures)
+    self.sheets[sheet] = textures
+    self.sheet_bytes[sheet] = sheet_size(textures)
+    if config is not None:
+      self.sheet_configs[sheet] = config
+
+    # now that the grid is known, recompile and check the config against it
+    errors = compile_config(sheet, config, [len(row) for row in textures])
+    if errors and errors != self.config_errors.get(sheet):
+      warnings.warn('\n'.join(errors))
+    self.config_errors[sheet] = errors
+
+    self.trim()
+    return textures
+
+  # unloads the least recently used sheets until under the memory budget,
+  # the most recently used sheet is always kept
+  def trim(self) -> None:
+    if self.max_bytes is None:
+      return
+
+    while len(self.sheets) > 1 and self.loaded_bytes > self.max_bytes:
+      self.unload(next(iter(self.sheets)))
+
+  # drops a sheet's textures, they get sliced again on next use
+  def unload(self, sheet: str) -> None:
+    self.sheets.pop(sheet, None)
+    self.sheet_bytes.pop(sheet, None)
+    self.areas.pop(sheet, None)
+
+  # returns the bytes of pixel data held by all loaded sheets
+  @property
+  def loaded_bytes(self) -> int:
+    return sum(self.sheet_bytes.values())
+
+  # returns whether a sheet has an asset at a row and col
+  def has_asset(self, sheet, row, col) -> bool:
+    return in_grid(self.get_sheet(sheet), row, col)
+
+  # returns surface given a sheet name with a row and col value, assets cut
+  # from the sheet since they were placed get the empty missing surface
   def get_asset(self, sheet, row, col) -> Surface:
-    return self.sheets[sheet][row][col]
+    textures = self.get_sheet(sheet)
+    if not in_grid(textures, row, col):
+      return self.missing
+    return textures[row][col]
+
+  # returns the surface and area to blit for an asset, the area is None
+  # when not in atlas mode
+  def get_area(self, sheet, row, col) -> tuple[Surface, pygame.Rect]:
+    if not self.atlas:
+      return self.get_asset(sheet, row, col), None
+    if sheet not in self.areas:
+      self.get_sheet(sheet)
+    else:
+      self.sheets.move_to_end(sheet)
+
+    areas = self.areas.get(sheet, [])
+    if not in_grid(areas, row, col):
+      return self.missing, None
+    return areas[row][col]
 
+  # returns the render offset of an asset from its sheet's config
   def get_config_info(self, sheet, row, col) -> tuple:
-    if sheet in self.sheet_configs:
-      return self.sheet_configs[sheet][row][col]
-    return 0, 0
\ No newline at end of file
+    return palette.offsets[palette.intern((sheet, row, col))]
@@ -0,0 +1,83 @@
+import math
+import pygame
+
+# uniform grid of buckets holding items by id, items are points so each
+# one lives in exactly one bucket
+class SpatialHash:
+  # init
+  def __init__(self, cell_size: int):
+    self.cell_size = cell_size
+
+    # bucket pos -> item id -> (pos, item)
+    self.buckets = {}
+
+    # item id -> bucket pos
+    self.cells = {}
+
+  # returns the bucket a point falls in
+  def cell(self, pos: tuple) -> tuple:
+    return int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+
+  # adds an item at pos, replacing any item already using the id
+  def insert(self, item_id: int, pos: tuple, item: object) -> None:
+    if item_id in self.cells:
+      self.remove(item_id)
+    cell = self.cell(pos)
+    if cell not in self.buckets:
+      self.buckets[cell] = {}
+    self.buckets[cell][item_id] = pos, item
+    self.cells[item_id] = cell
+
+  # removes an item by id and returns it, or None if there isn't one
+  def remove(self, item_id: int) -> object:
+    cell = self.cells.pop(item_id, None)
+    if cell is None:
+      return None
+    bucket = self.buckets[cell]
+    _, item = bucket.pop(item_id)
+    if not bucket:
+      del self.buckets[cell]
+    return item
+
+  # returns the item with the given id, or None
+  def get(self, item_id: int) -> object:
+    cell = self.cells.get(item_id)
+    if cell is None:
+      return None
+    return self.buckets[cell][item_id][1]
+
+  # returns the items whose pos is inside the rect, only the buckets under
+  # the rect are looked at
+  def range(self, query: pygame.Rect) -> list:
+    size = self.cell_size
+    x0, y0 = query.left, query.top
+    x1, y1 = query.right, query.bottom
+    found = []
+
+    # walk whichever is smaller, the covered buckets or all of them
+    bx0, by0 = int(x0 // size), int(y0 // size)
+    bx1, by1 = math.ceil(x1 / size), math.ceil(y1 / size)
+    if (bx1 - bx0) * (by1 - by0) < len(self.buckets):
+      buckets = (self.buckets.get((bx, by)) for bx in range(bx0, bx1)
+                 for by in range(by0, by1))
+    else:
+      buckets = (bucket for (bx, by), bucket in self.buckets.items()
+                 if bx0 <= bx < bx1 and by0 <= by < by1)
+
+    for bucket in buckets:
+      if not bucket:
+        continue
+      for (x, y), item in bucket.values():
+        if x0 <= x < x1 and y0 <= y < y1:
+          found.append(item)
+    return found
+
+  # returns the number of items
+  def __len__(self) -> int:
+    return len(self.cells)
+
+  # yields every item
+  def __iter__(self) -> iter:
+    for bucket in self.buckets.values():
+      for _, item in bucket.values():
+        yield item
@@ -0,0 +1,102 @@
+import pygame
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pygame.transform import scale
+
+PADDING = 10
+
+# scales every texture in a sheet for the texture palette, returns the scaled
+# rows, their total height with padding and their size in bytes
+def scale_sheet(textures: list, tex_zoom: float) -> tuple[list, int, int]:
+  rows = []
+  tot_h = 0
+  size = 0
+
+  for row in textures:
+
+    new_row = []
+
+    max_h = 0
+
+    for surf in row:
+
+      w = surf.get_width() * tex_zoom
+      h = surf.get_height() * tex_zoom
+
+      scaled_surf = pygame.Surface((w, h))
+      scaled_surf.blit(scale(surf, (w, h)), (0, 0))
+      scaled_surf.set_colorkey((0, 0, 0))
+
+      new_row.append(scaled_surf)
+      size += scaled_surf.get_width() * scaled_surf.get_height() * \
+        scaled_surf.get_bytesize()
+
+      if h > max_h:
+        max_h = h
+
+    rows.append(new_row)
+    tot_h += max_h + PADDING
+
+  return rows, tot_h, size
+
+class TexCache:
+  # init, max_bytes caps the memory held by scaled palettes and background
+  # scales sheets on a worker thread instead of stalling the frame
+  def __init__(self, max_bytes: int=64 * 2 ** 20, background: bool=False):
+    self.max_bytes = max_bytes
+    self.background = background
+
+    # (sheet, tex zoom) -> (rows, total height, bytes), least recent first
+    self.entries = OrderedDict()
+    self.pending = {}
+    self.pool = ThreadPoolExecutor(max_workers=1) if background else None
+
+  # returns the scaled rows and total height for a sheet at a zoom, or None
+  # while it's still being scaled in the background
+  def get(self, key: tuple, textures: list) -> tuple[list, int]:
+    if key in self.entries:
+      self.entries.move_to_end(key)
+      rows, tot_h, _ = self.entries[key]
+      return rows, tot_h
+
+    if self.background:
+      self.prefetch(key, textures)
+      return None
+
+    self._store(key, scale_sheet(textures, key[1]))
+    return self.entries[key][:2]
+
+  # starts scaling a sheet in the background if it isn't cached already
+  def prefetch(self, key: tuple, textures: list) -> None:
+    if not self.background or key in self.entries or key in self.pending:
+      return
+    self.pending[key] = self.pool.submit(scale_sheet, textures, key[1])
+
+  # moves finished background scales into the cache, returns their keys
+  def collect(self) -> list[tuple]:
+    done = [key for key, job in self.pending.items() if job.done()]
+    for key in done:
+      self._store(key, self.pending.pop(key).result())
+    return done
+
+  # caches a scaled sheet as the most recent entry, then evicts the least
+  # recently used entries while over the memory cap
+  def _store(self, key: tuple, entry: tuple) -> None:
+    self.entries[key] = entry
+    self.entries.move_to_end(key)
+    while len(self.entries) > 1 and self.size > self.max_bytes:
+      self.entries.popitem(last=False)
+
+  # drops every cached or pending scale of a sheet
+  def invalidate(self, sheet: str) -> None:
+    for key in [k for k in self.entries if k[0] == sheet]:
+      del self.entries[key]
+    for key in [k for k in self.pending if k[0] == sheet]:
+      self.pending.pop(key).cancel()
+
+  # returns the bytes held by all cached scales
+  @property
+  def size(self) -> int:
+    return sum(entry[2] for entry in self.entries.values())
@@ -1,134 +1,505 @@
 import math
-import time
 import pygame
 
-from mods.kd import KDTree
+from array import array
+from bisect import insort
+from itertools import count, repeat
+from numbers import Integral
+
+from mods.assets import palette
+from mods.components import Components
+from mods.rtree import RTree
+from mods.spatialhash import SpatialHash
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 neighbors = ((0, -1), (1, 0), (0, 1), (-1, 0))
-entity_id = 1
+diagonals = ((1, -1), (1, 1), (-1, 1), (-1, -1))
+
+# asset id stored in empty tile slots
+EMPTY = -1
+
+# 8 neighbor blob masks weigh n, ne, e, se, s, sw, w, nw as 1, 2, 4 ... 128
+# and only count a corner when both edges next to it are set, leaving 47
+# possible masks. blob sheets keep those variants on rows in mask order
+BLOB_MASKS = [m for m in range(256)
+              if all(not m & c or (m & a and m & b) for a, c, b in
+                     ((1, 2, 4), (4, 8, 16), (16, 32, 64), (64, 128, 1)))]
+BLOB_ROWS = [BLOB_MASKS.index(m) if m in BLOB_MASKS else 0
+             for m in range(256)]
+
+# a square block of tiles on one layer, stored as flat row major arrays of
+# interned asset ids and autotile bitsums
+class Chunk:
+  __slots__ = ('ids', 'bits', 'count')
+
+  def __init__(self, tiles_per_chunk: int):
+    n = tiles_per_chunk * tiles_per_chunk
+    self.ids = array('i', [EMPTY]) * n
+    self.bits = array('B', bytes(n))
+    self.count = 0
+
+# a tile placed on the map, x and y are the tile's top left in pixels
+class Tile:
+  __slots__ = ('x', 'y', 'asset_id')
+
+  def __init__(self, x: float, y: float, asset_id: int):
+    self.x = x
+    self.y = y
+    self.asset_id = asset_id
+
+  # returns the (sheet, row, col) of the asset
+  @property
+  def asset(self) -> tuple:
+    return palette.assets[self.asset_id]
+
+  # returns the pixel pos as a tuple
+  @property
+  def pos(self) -> tuple:
+    return self.x, self.y
+
+# a decoration placed off grid, x and y are its top left in pixels and w
+# and h its asset's size
+class Decor(Tile):
+  __slots__ = ('w', 'h')
+
+  def __init__(self, x: float, y: float, asset_id: int, w: int, h: int):
+    super().__init__(x, y, asset_id)
+    self.w = w
+    self.h = h
+
+  # returns the box the decor is drawn in, shifted by its config offset
+  @property
+  def box(self) -> tuple:
+    off_x, off_y = palette.offsets[self.asset_id]
+    x, y = self.x + off_x, self.y + off_y
+    return x, y, x + self.w, y + self.h
+
+# an entity placed off grid with a unique id
+class Entity(Tile):
+  __slots__ = ('id',)
+
+  def __init__(self, x: float, y: float, asset_id: int, unique_id: int):
+    super().__init__(x, y, asset_id)
+    self.id = unique_id
+
+# the tiles one bulk edit wrote and the tiles it replaced or removed, enough
+# to redraw the touched cells or undo the edit
+class Change:
+  __slots__ = ('layer', 'added', 'removed')
+
+  def __init__(self, layer: str):
+    self.layer = layer
+    self.added = []
+    self.removed = []
+
+  # returns the pixel positions the edit touched
+  @property
+  def cells(self) -> set:
+    return {tile.pos for tile in self.added} | \
+      {tile.pos for tile in self.removed}
+
+# the tiles get_visible found for a tile window at a map version
+class Visible:
+  __slots__ = ('window', 'version', 'layers', 'size', 'tiles', 'layer_data')
+
+  def __init__(self, window: tuple, version: int, layers: list):
+    self.window = window
+    self.version = version
+    self.layers = layers
+    self.size = window[2] - window[0], window[3] - window[1]
+    self.tiles = {}
+    self.layer_data = None
+
+# returns True if two (x0, y0, x1, y1) tile windows share a cell
+def _overlaps(a: tuple, b: tuple) -> bool:
+  return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+# yields the strips of window a that are outside window b, the columns
+# first and then the rows between them
+def _window_diff(a: tuple, b: tuple) -> iter:
+  x0, y0, x1, y1 = a
+  if x0 < b[0]:
+    yield x0, y0, min(b[0], x1), y1
+  if b[2] < x1:
+    yield max(b[2], x0), y0, x1, y1
+  mx0, mx1 = max(x0, b[0]), min(x1, b[2])
+  if y0 < b[1]:
+    yield mx0, y0, mx1, min(b[1], y1)
+  if b[3] < y1:
+    yield mx0, max(b[3], y0), mx1, y1
 
 class TileMap:
-  def __init__(self, tile_size: int):
+  def __init__(self, tile_size: int, tiles_per_chunk: int=8):
     self.tile_size = tile_size
-    self.tiles = {}
+    self.tiles_per_chunk = tiles_per_chunk
+
+    # tiles are stored per layer in square chunks of tiles_per_chunk tiles,
+    # layer -> chunk pos -> Chunk
+    self.chunks = {}
     self.off_grid = {}
     self.layers = []
+    # layer -> SpatialHash of entities bucketed per chunk
     self.entities = {}
+    self.entity_ids = count(1)
+
+    # connected tiles of each layer, built on the first select
+    self.components = {}
+
+    # most cells a single flood fill may cover
+    self.max_flood = 2 ** 20
+
+    # bumped by every edit so cached views know to refresh
+    self.version = 0
+    self.visible = None
 
   # adds a tile to the tile map system (pos is assuemd to already be tiled)
   def add_tile(self, pos: tuple, _type: str, asset: tuple, layer: str,
                autotile: bool=False) -> None:
-    pos = tuple(pos)
-    raw = pos[0] * self.tile_size, pos[1] * self.tile_size
-
-    tile_info = {'pos':pos,
-                'type':_type,
-                'asset':asset,
-                'raw':[raw, asset]}
-
-    if pos not in self.tiles:
-      self.tiles[pos] = {layer:tile_info}
-    else:
-      self.tiles[pos][layer] = tile_info
+    pos = int(pos[0]), int(pos[1])
+
+    if layer not in self.chunks:
+      self.chunks[layer] = {}
+    chunk_pos = self.chunk_pos(pos)
+    chunk = self.chunks[layer].get(chunk_pos)
+    if not chunk:
+      chunk = self.chunks[layer][chunk_pos] = Chunk(self.tiles_per_chunk)
+
+    i = self._index(pos)
+    if chunk.ids[i] == EMPTY:
+      chunk.count += 1
+      if layer in self.components:
+        self.components[layer].add(pos)
+    chunk.ids[i] = palette.intern(asset)
+    chunk.bits[i] = 0
+    self.version += 1
 
     if autotile:
       self.auto_tile(pos, layer, True)
 
-    if layer not in self.layers:
-      self.layers.append(layer)
-      self.layers.sort()
+    self._add_layer(layer)
 
   # removes a tile from the tile map system
   def remove_tile(self, pos: tuple, layer: str, autotile: bool=False) -> dict:
-    pos = tuple(pos)
-    if pos not in self.tiles:
+    pos = int(pos[0]), int(pos[1])
+    chunk_pos = self.chunk_pos(pos)
+    chunk = self.chunks.get(layer, {}).get(chunk_pos)
+    if not chunk:
       return
-    if layer not in self.tiles[pos]:
+    i = self._index(pos)
+    asset_id = chunk.ids[i]
+    if asset_id == EMPTY:
       return
 
-    data = self.tiles[pos][layer]
-    del self.tiles[pos][layer]
-
-    if not self.tiles[pos]:
-      del self.tiles[pos]
+    chunk.ids[i] = EMPTY
+    chunk.count -= 1
+    if not chunk.count:
+      del self.chunks[layer][chunk_pos]
+    if layer in self.components:
+      self.components[layer].remove(pos)
+    self.version += 1
 
     if autotile:
       self._update_neighbor_bitsums(pos, layer)
 
-    return data
+    return Tile(pos[0] * self.tile_size, pos[1] * self.tile_size, asset_id)
 
-  # adds an object into the off_grid dictionary
+  # keeps the sorted layer list up to date
+  def _add_layer(self, layer: str) -> None:
+    if layer not in self.layers:
+      insort(self.layers, layer)
+
+  # adds many tiles in one pass. assets is either one asset used for every
+  # pos or an iterable of assets or interned ids lined up with positions
+  def add_tiles(self, positions: iter, assets: iter, layer: str,
+                autotile: bool=False) -> Change:
+    return self._edit_tiles(layer, positions, self._asset_ids(assets),
+                            autotile)
+
+  # removes many tiles in one pass
+  def remove_tiles(self, positions: iter, layer: str,
+                   autotile: bool=False) -> Change:
+    return self._edit_tiles(layer, positions, repeat(EMPTY), autotile)
+
+  # swaps the assets of existing tiles in one pass, empty cells are skipped
+  def replace_tiles(self, positions: iter, assets: iter, layer: str,
+                    autotile: bool=False) -> Change:
+    return self._edit_tiles(layer, positions, self._asset_ids(assets),
+                            autotile, True)
+
+  # undoes a change returned by one of the bulk edits
+  def revert(self, change: Change, autotile: bool=False) -> Change:
+    t_size = self.tile_size
+    positions = [(tile.x // t_size, tile.y // t_size)
+                 for tile in change.added + change.removed]
+    asset_ids = [EMPTY] * len(change.added) + \
+      [tile.asset_id for tile in change.removed]
+    return self._edit_tiles(change.layer, positions, asset_ids, autotile)
+
+  # yields interned ids for one asset or an iterable of assets or ids,
+  # numpy integers count as ids too
+  def _asset_ids(self, assets: iter) -> iter:
+    if isinstance(assets, tuple) and assets and isinstance(assets[0], str):
+      return repeat(palette.intern(assets))
+    return (int(asset) if isinstance(asset, Integral) else
+            palette.intern(asset) for asset in assets)
+
+  # writes asset ids into tiled positions, EMPTY clears a cell. the layer is
+  # registered and the touched area autotiled once for the whole batch. a
+  # position written more than once keeps its first old state and its last
+  # new one in the change
+  def _edit_tiles(self, layer: str, positions: iter, asset_ids: iter,
+                  autotile: bool, replace_only: bool=False) -> Change:
+    change = Change(layer)
+    layer_chunks = self.chunks.get(layer, {})
+    tpc = self.tiles_per_chunk
+    t_size = self.tile_size
+    components = self.components.get(layer)
+
+    # cell -> asset id before the batch and after it
+    before = {}
+    after = {}
+
+    for pos, asset_id in zip(positions, asset_ids):
+      x, y = int(pos[0]), int(pos[1])
+      chunk_pos = x // tpc, y // tpc
+      chunk = layer_chunks.get(chunk_pos)
+      if not chunk:
+        if asset_id == EMPTY or replace_only:
+          continue
+        chunk = layer_chunks[chunk_pos] = Chunk(tpc)
+
+      i = y % tpc * tpc + x % tpc
+      old_id = chunk.ids[i]
+      if old_id == EMPTY:
+        if asset_id == EMPTY or replace_only:
+          continue
+        chunk.count += 1
+        if components:
+          components.add((x, y))
+
+      if (x, y) not in before:
+        before[(x, y)] = old_id
+      after[(x, y)] = asset_id
+      if asset_id == EMPTY:
+        chunk.ids[i] = EMPTY
+        chunk.count -= 1
+        if not chunk.count:
+          del layer_chunks[chunk_pos]
+        if components:
+          components.remove((x, y))
+        continue
+
+      chunk.ids[i] = asset_id
+      chunk.bits[i] = 0
+
+    if not before:
+      return change
+    self.version += 1
+    if any(asset_id != EMPTY for asset_id in after.values()):
+      self.chunks[layer] = layer_chunks
+      self._add_layer(layer)
+
+    # the added records take the variants autotiling picked for them
+    if autotile:
+      self.auto_tile_region(layer, before)
+    for (x, y), asset_id in after.items():
+      if asset_id != EMPTY:
+        change.added.append(Tile(x * t_size, y * t_size,
+                                 self.get_id((x, y), layer)))
+    for (x, y), asset_id in before.items():
+      if asset_id != EMPTY:
+        change.removed.append(Tile(x * t_size, y * t_size, asset_id))
+
+    return change
+
+  # adds an object into the off_grid dictionary, size is the asset's size in
+  # pixels and defaults to one tile
   def add_off_grid(self, pos: tuple, _type: str, asset: tuple,
-                   layer: str) -> dict:
+                   layer: str, size: tuple=None) -> Tile:
     pos = tuple(pos)
+    asset_id = palette.intern(asset)
 
-    off_grid_info = {'pos':pos,
-                     'type':_type,
-                     'asset':asset,
-                     'raw':[pos, asset]}
-
-    # entities are just spatial hashed during map creation
+    # entities are spatial hashed one bucket per chunk
     if _type == 'entities':
-      unique_id = int(time.time() * 100 + entity_id * 10000)
       if layer not in self.entities:
-        self.entities[layer] = []
-      off_grid_info['id'] = unique_id
-      self.entities[layer].append(off_grid_info)
-      entity_id += 1
+        self.entities[layer] = SpatialHash(self.tile_size *
+                                           self.tiles_per_chunk)
+      unique_id = next(self.entity_ids)
+      record = Entity(*pos, asset_id, unique_id)
+      self.entities[layer].insert(unique_id, pos, record)
 
     else:
       if layer not in self.off_grid:
-        self.off_grid[layer] = KDTree(90)
-      self.off_grid[layer].put(pos, off_grid_info)
-
-    if layer not in self.layers:
-      self.layers.append(layer)
-      self.layers.sort()
+        self.off_grid[layer] = RTree()
+      record = Decor(*pos, asset_id, *(size or (self.tile_size,
+                                                self.tile_size)))
+      self.off_grid[layer].insert(record.box, record)
+
+    self._add_layer(layer)
+    self.version += 1
+    return record
+
+  # removes an entity by its id and returns it
+  def remove_entity(self, unique_id: int, layer: str) -> Entity:
+    if layer not in self.entities:
+      return None
+    entity = self.entities[layer].remove(unique_id)
+    if entity:
+      self.version += 1
+    return entity
 
   # removes an object from the off_grid dictionary
   def remove_off_grid(self, rect: pygame.Rect, layer: str) -> list:
-    if layer not in self.tiles:
-      return
-
-    remove = []
-    for i, tile in sorted(enumerate(self.off_grid[layer]), reverse=True):
-      tile_rect = pygame.Rect(tile['raw'][0][0], tile['raw'][0][1],
-                              self.tile_size, self.tile_size)
-      if rect.colliderect(tile_rect):
-        remove.append(self.off_grid[layer][i])
-        self.off_grid[layer].pop(i)
+    if layer not in self.off_grid:
+      return []
 
-    return remove
+    removed = self.off_grid[layer].remove_range(rect)
+    if removed:
+      self.version += 1
+    return removed
+
+  # replaces a layer's decor with (pos, asset, size) items in one bulk load,
+  # size can be None for one tile, and returns the new records
+  def build_off_grid(self, layer: str, items: iter) -> list:
+    records = [Decor(*pos, palette.intern(asset),
+                     *(size or (self.tile_size, self.tile_size)))
+               for pos, asset, size in items]
+    if layer not in self.off_grid:
+      self.off_grid[layer] = RTree()
+    self.off_grid[layer].build((record.box, record) for record in records)
+
+    if records:
+      self._add_layer(layer)
+    self.version += 1
+    return records
+
+  # rebuilds the boxes of decor from the given sheets (all by default), to
+  # be called once their config offsets have changed
+  def refresh_off_grid(self, sheets: list=None) -> None:
+    for tree in self.off_grid.values():
+      records = list(tree)
+      if sheets is not None and not any(r.asset[0] in sheets
+                                        for r in records):
+        continue
+      tree.build((record.box, record) for record in records)
+      self.version += 1
+
+  # removes the decor drawn over a pixel pos and returns it
+  def remove_decor(self, pos: tuple, layer: str) -> Decor:
+    if layer not in self.off_grid:
+      return None
+    decor = self.off_grid[layer].remove(pos)
+    if decor:
+      self.version += 1
+    return decor
+
+  # returns the k decor drawn closest to a pixel pos, closest first
+  def nearest_decor(self, pos: tuple, layer: str, k: int=1) -> list:
+    if layer not in self.off_grid:
+      return []
+    return self.off_grid[layer].k_nearest(pos, k)
 
-  # returns all tiles visible within the given rect
-  def get_visible(self, pos: tuple, size: int) -> list:
-    layer_data = {l : [] for l in self.layers}
+  # returns the decor drawn within radius pixels of a pixel pos
+  def decor_within(self, pos: tuple, radius: float, layer: str) -> list:
+    if layer not in self.off_grid:
+      return []
+    return self.off_grid[layer].within_radius(pos, radius)
 
-    # gather tiles
+  # returns the tile window (x0, y0, x1, y1) a camera at pos can see
+  def _visible_window(self, pos: tuple, size: tuple) -> tuple:
     tiled_pos = (int(round(pos[0] / self.tile_size - 0.5, 0)),
           int(round(pos[1] / self.tile_size - 0.5, 0)))
-    for x in range(math.ceil(size[0] / self.tile_size) + 1):
-      for y in range(math.ceil(size[1] / self.tile_size) + 1):
-        tile_pos = x + tiled_pos[0], y + tiled_pos[1]
-        if tile_pos in self.tiles:
-          for tile in self.tiles[tile_pos]:
-            layer_data[tile].append(self.tiles[tile_pos][tile]['raw'])
-
-    query_rect = pygame.Rect(pos, size)
-
-    # gather decor
-    for layer in self.off_grid:
-      query = self.off_grid[layer].range(query_rect)
-      for decor in query:
-        layer_data[layer].append(decor['raw'])
-
-    # gather entities
-    for layer in self.entities:
-      for entity in self.entities[layer]:
-        if query_rect.collidepoint(entity['pos']):
-          layer_data[layer].append(entity['raw'])
+    return (*tiled_pos, tiled_pos[0] + math.ceil(size[0] / self.tile_size) + 1,
+            tiled_pos[1] + math.ceil(size[1] / self.tile_size) + 1)
+
+  # returns the pixel rect of a tile window
+  def _window_rect(self, window: tuple) -> pygame.Rect:
+    t_size = self.tile_size
+    return pygame.Rect(window[0] * t_size, window[1] * t_size,
+                       (window[2] - window[0]) * t_size,
+                       (window[3] - window[1]) * t_size)
+
+  # yields the tile records in a tile window
+  def _iter_records(self, layer: str, window: tuple) -> iter:
+    t_size = self.tile_size
+    for x, y, asset_id in self._iter_window(layer, *window):
+      yield Tile(x * t_size, y * t_size, asset_id)
+
+  # yields the decor whose box overlaps a pixel rect and the entities whose
+  # pos is inside it
+  def _iter_off_grid(self, layer: str, rect: pygame.Rect) -> iter:
+    if layer in self.off_grid:
+      yield from self.off_grid[layer].range(rect)
+    if layer in self.entities:
+      yield from self.entities[layer].range(rect)
+
+  # yields everything visible to a camera at pos without caching, one layer
+  # or every layer in draw order
+  def iter_visible(self, pos: tuple, size: tuple, layer: str=None) -> iter:
+    window = self._visible_window(pos, size)
+    query_rect = self._window_rect(window)
+    for l in (self.layers if layer is None else (layer,)):
+      yield from self._iter_records(l, window)
+      yield from self._iter_off_grid(l, query_rect)
 
-    return [layer_data[l] for l in self.layers]
+  # returns all tiles visible within the given rect
+  def get_visible(self, pos: tuple, size: int) -> list:
+    window = self._visible_window(pos, size)
+
+    # nothing moved a whole tile and nothing was edited
+    cache = self.visible
+    if cache and cache.window == window and cache.version == self.version:
+      return cache.layer_data
+
+    # a scroll that keeps the window size only swaps the edge strips
+    if cache and cache.version == self.version and cache.layers == self.layers \
+        and cache.size == (window[2] - window[0], window[3] - window[1]) \
+        and _overlaps(cache.window, window):
+      self._scroll_visible(cache, window)
+    else:
+      cache = self.visible = self._build_visible(window)
+
+    # decor and entities are few enough to gather again for the new window
+    query_rect = self._window_rect(window)
+    cache.layer_data = []
+    for layer in self.layers:
+      # row major order so overlapping tiles draw the same way no matter
+      # which strips the cache picked up while scrolling
+      tiles = cache.tiles[layer]
+      data = [tiles[cell] for cell in
+              sorted(tiles, key=lambda cell: (cell[1], cell[0]))]
+      data.extend(self._iter_off_grid(layer, query_rect))
+      cache.layer_data.append(data)
+
+    return cache.layer_data
+
+  # gathers every tile in a window from scratch
+  def _build_visible(self, window: tuple) -> 'Visible':
+    cache = Visible(window, self.version, list(self.layers))
+    t_size = self.tile_size
+    for layer in self.layers:
+      cache.tiles[layer] = {(tile.x // t_size, tile.y // t_size): tile
+                            for tile in self._iter_records(layer, window)}
+    return cache
+
+  # moves a cached window, dropping the strips it left and adding the
+  # strips it entered
+  def _scroll_visible(self, cache: 'Visible', window: tuple) -> None:
+    t_size = self.tile_size
+    for layer in self.layers:
+      tiles = cache.tiles[layer]
+      for x0, y0, x1, y1 in _window_diff(cache.window, window):
+        for y in range(y0, y1):
+          for x in range(x0, x1):
+            tiles.pop((x, y), None)
+      for strip in _window_diff(window, cache.window):
+        for tile in self._iter_records(layer, strip):
+          tiles[(tile.x // t_size, tile.y // t_size)] = tile
+    cache.window = window
 
   # returns a tile's surrounding bitsum
   def calculate_bitsum(self, pos: tuple, layer: str, sset: bool=False) -> int:
@@ -136,43 +507,70 @@ class TileMap:
     neighbor_weight = 1
     for x, y in neighbors:
       new_pos = pos[0] + x, pos[1] + y
-      if self.get_tile(new_pos, layer):
+      if self.get_id(new_pos, layer) != EMPTY:
         bitsum += neighbor_weight
       neighbor_weight *= 2
 
     if sset:
-      asset_data = self.tiles[pos][layer]['asset']
-      new_asset_data = asset_data[0], bitsum, asset_data[2]
-      self.tiles[pos][layer]['asset'] = new_asset_data
-
-      raw_asset_data = self.tiles[pos][layer]['raw'][1]
-      new_raw_asset_data = raw_asset_data[0], bitsum, raw_asset_data[2]
-      self.tiles[pos][layer]['raw'][1] = new_raw_asset_data
+      chunk = self.chunks[layer][self.chunk_pos(pos)]
+      i = self._index(pos)
+      chunk.ids[i] = palette.with_row(chunk.ids[i], bitsum)
+      chunk.bits[i] = bitsum
+      self.version += 1
 
     return bitsum
 
   # auto tiles a tile and its surrounding neighbors
   def auto_tile(self, pos: tuple, layer: str, sset: bool=True) -> None:
+    pos = int(pos[0]), int(pos[1])
     self.calculate_bitsum(pos, layer, sset)
     self._update_neighbor_bitsums(pos, layer)
 
-  # returns a tiles raw data
-  def get_tile(self, pos: tuple, layer: str) -> tuple:
-    if pos in self.tiles and layer in self.tiles[pos]:
-      return self.tiles[pos][layer]['raw']
+  # returns the chunk pos containing a tile pos
+  def chunk_pos(self, pos: tuple) -> tuple:
+    return pos[0] // self.tiles_per_chunk, pos[1] // self.tiles_per_chunk
+
+  # returns the index of a tile pos inside its chunk's arrays
+  def _index(self, pos: tuple) -> int:
+    tpc = self.tiles_per_chunk
+    return pos[1] % tpc * tpc + pos[0] % tpc
+
+  # returns the asset id of a tile, or EMPTY if there's no tile there
+  def get_id(self, pos: tuple, layer: str) -> int:
+    chunk = self.chunks.get(layer, {}).get(self.chunk_pos(pos))
+    if not chunk:
+      return EMPTY
+    return chunk.ids[self._index(pos)]
+
+  # yields (x, y, asset id) for every tile on a layer with x0 <= x < x1 and
+  # y0 <= y < y1, going through the overlapped chunks one at a time
+  def _iter_window(self, layer: str, x0: int, y0: int, x1: int,
+                   y1: int) -> iter:
+    layer_chunks = self.chunks.get(layer)
+    if not layer_chunks or x1 <= x0 or y1 <= y0:
+      return
 
-  # private method used for updating neighbor bitsums for autotiling
-  # (assumes tile can be autotiled)
-  def _update_neighbor_bitsums(self, pos: tuple, layer: str) -> None:
-    for x, y in neighbors:
-      neighbor = pos[0] + x, pos[1] + y
-      if neighbor in self.tiles and layer in self.tiles[neighbor]:
-        self.calculate_bitsum(neighbor, layer, True)
+    tpc = self.tiles_per_chunk
+    for cx in range(x0 // tpc, (x1 - 1) // tpc + 1):
+      for cy in range(y0 // tpc, (y1 - 1) // tpc + 1):
+        chunk = layer_chunks.get((cx, cy))
+        if not chunk:
+          continue
 
-  # returns all tiles within specified rect
-  def get_tiles(self, rect: pygame.Rect, layer: str, f: callable=None,
-                inclusive: bool=True) -> list:
-    tiles = []
+        # clip the window to the chunk and walk just those rows
+        ox, oy = cx * tpc, cy * tpc
+        lx0, lx1 = max(x0 - ox, 0), min(x1 - ox, tpc)
+        ly0, ly1 = max(y0 - oy, 0), min(y1 - oy, tpc)
+        ids = chunk.ids
+        for ly in range(ly0, ly1):
+          row = ly * tpc
+          for lx in range(lx0, lx1):
+            asset_id = ids[row + lx]
+            if asset_id != EMPTY:
+              yield ox + lx, oy + ly, asset_id
+
+  # returns the tile window (x0, y0, x1, y1) covered by a rect
+  def _rect_window(self, rect: pygame.Rect, inclusive: bool) -> tuple:
     if inclusive:
       pos = (int(round(rect.x / self.tile_size - 0.5, 0)),
              int(round(rect.y / self.tile_size - 0.5, 0)))
@@ -182,87 +580,403 @@ class TileMap:
       pos = int(rect.x / self.tile_size), int(rect.y / self.tile_size)
       ranges = (math.ceil(rect.w / self.tile_size),
                 math.ceil(rect.h / self.tile_size))
-    for x in range(ranges[0]):
-      for y in range(ranges[1]):
-        curr_pos = pos[0] + x, pos[1] + y
-        if curr_pos in self.tiles and layer in self.tiles[curr_pos]:
-          if f:
-            tiles.append(f(self.tiles[curr_pos][layer]))
-          else:
-            tiles.append(self.tiles[curr_pos][layer]['raw'])
+    return *pos, pos[0] + ranges[0], pos[1] + ranges[1]
 
-    return tiles
-
-  # flood fills an area with tiles and can autotile the tiles too
-  def flood(self, pos: tuple, layer: str, rect: pygame.Rect,
-            asset: tuple, autotile: bool=False) -> int:
-
-    open_l = [pos]
-    closed_l = self.get_tiles(rect, layer, lambda x: x['pos'])
-    new_tiles = []
-
-    if pos in closed_l:
-      return
+  # returns the tile at a tiled pos
+  def get_tile(self, pos: tuple, layer: str) -> Tile:
+    pos = int(pos[0]), int(pos[1])
+    asset_id = self.get_id(pos, layer)
+    if asset_id != EMPTY:
+      return Tile(pos[0] * self.tile_size, pos[1] * self.tile_size, asset_id)
 
-    while len(open_l) > 0:
-      curr = open_l.pop(0)
-
-      for x, y in neighbors:
-        neighbor = curr[0] + x, curr[1] + y
-        rect_pos = (neighbor[0] * self.tile_size + self.tile_size / 2,
-                    neighbor[1] * self.tile_size + self.tile_size / 2)
-        if neighbor in closed_l or not rect.collidepoint(rect_pos):
-          continue
+  # private method used for updating neighbor bitsums for autotiling
+  # (assumes tile can be autotiled)
+  def _update_neighbor_bitsums(self, pos: tuple, layer: str) -> None:
+    for x, y in neighbors:
+      neighbor = pos[0] + x, pos[1] + y
+      if self.get_id(neighbor, layer) != EMPTY:
+        self.calculate_bitsum(neighbor, layer, True)
 
-        if neighbor not in open_l:
-          open_l.append(neighbor)
+  # returns all tiles within specified rect
+  def get_tiles(self, rect: pygame.Rect, layer: str, f: callable=None,
+                inclusive: bool=True) -> list:
+    tiles = self.iter_tiles(rect, layer, inclusive)
+    return [f(tile) for tile in tiles] if f else list(tiles)
 
-      closed_l.append(curr)
-      new_tiles.append(curr)
+  # yields the tiles within a rect one at a time
+  def iter_tiles(self, rect: pygame.Rect, layer: str,
+                 inclusive: bool=True) -> iter:
+    return self._iter_records(layer, self._rect_window(rect, inclusive))
 
-    for tile_pos in new_tiles:
-      self.add_tile(tile_pos, 'tile', asset, layer)
+  # flood fills an area with tiles and can autotile the tiles too, returns
+  # the change or None if the start cell is taken. fills bigger than
+  # max_flood cells are abandoned and return None too
+  def flood(self, pos: tuple, layer: str, rect: pygame.Rect,
+            asset: tuple, autotile: bool=False) -> Change:
 
-      if autotile:
-        self.auto_tile(tile_pos, layer, True)
+    pos = int(pos[0]), int(pos[1])
+    if self.get_id(pos, layer) != EMPTY:
+      return
 
-    return len(new_tiles)
+    # cells count as inside the rect when their center is
+    t_size = self.tile_size
+    x0 = math.ceil((rect.left - t_size / 2) / t_size)
+    x1 = math.ceil((rect.right - t_size / 2) / t_size)
+    y0 = math.ceil((rect.top - t_size / 2) / t_size)
+    y1 = math.ceil((rect.bottom - t_size / 2) / t_size)
+
+    filled = set()
+    get_id = self.get_id
+
+    def free(x: int, y: int) -> bool:
+      return x0 <= x < x1 and y0 <= y < y1 and (x, y) not in filled and \
+        get_id((x, y), layer) == EMPTY
+
+    # the start cell is filled even if its center is outside the rect
+    filled.add(pos)
+    stack = [(pos[0] + x, pos[1] + y) for x, y in neighbors]
+
+    # scanline fill, each popped seed fills its whole horizontal run and
+    # seeds the free runs directly above and below it
+    while stack:
+      x, y = stack.pop()
+      if not free(x, y):
+        continue
+
+      left = x
+      while free(left - 1, y):
+        left -= 1
+      right = x
+      while free(right + 1, y):
+        right += 1
+
+      filled.update((fx, y) for fx in range(left, right + 1))
+      if len(filled) > self.max_flood:
+        return None
+
+      for ny in (y - 1, y + 1):
+        in_run = False
+        for fx in range(left, right + 1):
+          if free(fx, ny):
+            if not in_run:
+              stack.append((fx, ny))
+              in_run = True
+          else:
+            in_run = False
+
+    asset_id = palette.intern(asset)
+    self._fill(layer, filled, asset_id)
+    change = Change(layer)
+    if not autotile:
+      change.added = [Tile(x * t_size, y * t_size, asset_id)
+                      for x, y in filled]
+      return change
+
+    # read the picked variants straight from the chunk arrays
+    self.auto_tile_region(layer, filled)
+    layer_chunks = self.chunks[layer]
+    tpc = self.tiles_per_chunk
+    change.added = [Tile(x * t_size, y * t_size,
+                         layer_chunks[(x // tpc, y // tpc)].ids[y % tpc * tpc +
+                                                              x % tpc])
+                    for x, y in filled]
+    return change
+
+  # writes the same asset into many empty cells at once
+  def _fill(self, layer: str, cells: set, asset_id: int) -> None:
+    if layer not in self.chunks:
+      self.chunks[layer] = {}
+    layer_chunks = self.chunks[layer]
+    tpc = self.tiles_per_chunk
+    components = self.components.get(layer)
+
+    for x, y in cells:
+      chunk_pos = x // tpc, y // tpc
+      chunk = layer_chunks.get(chunk_pos)
+      if not chunk:
+        chunk = layer_chunks[chunk_pos] = Chunk(tpc)
+      i = y % tpc * tpc + x % tpc
+      if chunk.ids[i] == EMPTY:
+        chunk.count += 1
+        if components:
+          components.add((x, y))
+      chunk.ids[i] = asset_id
+      chunk.bits[i] = 0
+
+    self._add_layer(layer)
+    self.version += 1
+
+  # autotiles the tiles at the given tiled positions and their neighbors, or
+  # every tile on the layer if cells is None, in one pass per chunk. blob
+  # uses the 8 neighbor mask instead of the 4 neighbor bitsum, returns the
+  # number of tiles updated
+  def auto_tile_region(self, layer: str, cells: iter=None,
+                       blob: bool=False) -> int:
+    layer_chunks = self.chunks.get(layer)
+    if not layer_chunks:
+      return 0
+    tpc = self.tiles_per_chunk
+
+    # group the given cells by chunk, empty cells still mark their neighbors
+    marks = None
+    if cells is not None:
+      marks = {}
+      for x, y in cells:
+        x, y = int(x), int(y)
+        chunk_pos = x // tpc, y // tpc
+        if chunk_pos not in marks:
+          marks[chunk_pos] = []
+        marks[chunk_pos].append(y % tpc * tpc + x % tpc)
+
+    if numpy is None:
+      return self._auto_tile_slots(layer, marks, blob)
+
+    # chunks with a marked cell in or right next to them
+    if marks is None:
+      targets = list(layer_chunks)
+    else:
+      targets = {(cx + ox, cy + oy) for cx, cy in marks
+                 for ox in (-1, 0, 1) for oy in (-1, 0, 1)}
+      targets = [chunk_pos for chunk_pos in targets
+                 if chunk_pos in layer_chunks]
+
+      mark_grids = {}
+      for chunk_pos, slots in marks.items():
+        grid = numpy.zeros(tpc * tpc, bool)
+        grid[slots] = True
+        mark_grids[chunk_pos] = grid.reshape(tpc, tpc)
+
+    # occupancy of the targets and the chunks bordering them
+    occ_grids = {}
+    for cx, cy in targets:
+      for ox in (-1, 0, 1):
+        for oy in (-1, 0, 1):
+          chunk_pos = cx + ox, cy + oy
+          if chunk_pos in layer_chunks and chunk_pos not in occ_grids:
+            ids = numpy.frombuffer(layer_chunks[chunk_pos].ids, numpy.intc)
+            occ_grids[chunk_pos] = (ids != EMPTY).reshape(tpc, tpc)
+
+    variants = {}
+    updated = 0
+    for chunk_pos in targets:
+      chunk = layer_chunks[chunk_pos]
+      occ = self._neighborhood(occ_grids, chunk_pos)
+      c, n, s = occ[1:-1, 1:-1], occ[:-2, 1:-1], occ[2:, 1:-1]
+      w, e = occ[1:-1, :-2], occ[1:-1, 2:]
+
+      if blob:
+        mask = n * 1 + (n & e & occ[:-2, 2:]) * 2 + e * 4 + \
+          (s & e & occ[2:, 2:]) * 8 + s * 16 + (s & w & occ[2:, :-2]) * 32 + \
+          w * 64 + (n & w & occ[:-2, :-2]) * 128
+        rows = numpy.take(BLOB_ROWS, mask)
+      else:
+        mask = rows = n * 1 + e * 2 + s * 4 + w * 8
+
+      # a tile is picked if it or a neighbor was marked
+      sel = c
+      if marks is not None:
+        m = self._neighborhood(mark_grids, chunk_pos)
+        picked = m[1:-1, 1:-1] | m[:-2, 1:-1] | m[2:, 1:-1] | m[1:-1, :-2] | \
+          m[1:-1, 2:]
+        if blob:
+          picked |= m[:-2, :-2] | m[:-2, 2:] | m[2:, :-2] | m[2:, 2:]
+        sel = sel & picked
+      sel = sel.ravel()
+      if not sel.any():
+        continue
+
+      # swap each distinct (asset, row) pair for its variant once
+      ids = numpy.frombuffer(chunk.ids, numpy.intc)
+      keys = ids[sel].astype(numpy.int64) * 256 + rows.ravel()[sel]
+      uniq, inverse = numpy.unique(keys, return_inverse=True)
+      new_ids = []
+      for key in uniq.tolist():
+        if key not in variants:
+          variants[key] = palette.with_row(key // 256, key % 256)
+        new_ids.append(variants[key])
+      ids[sel] = numpy.array(new_ids, numpy.intc)[inverse]
+      numpy.frombuffer(chunk.bits, numpy.uint8)[sel] = mask.ravel()[sel]
+      updated += len(keys)
+
+    if updated:
+      self.version += 1
+    return updated
+
+  # returns a chunk's [y][x] grid with a one tile border taken from the
+  # grids of the chunks around it, missing chunks count as empty
+  def _neighborhood(self, grids: dict, chunk_pos: tuple) -> object:
+    tpc = self.tiles_per_chunk
+    out = numpy.zeros((tpc + 2, tpc + 2), bool)
+    cx, cy = chunk_pos
+    spans = ((-1, 0), (slice(None), slice(1, -1)), (0, -1))
+    for gy, (sy, dy) in enumerate(spans):
+      for gx, (sx, dx) in enumerate(spans):
+        grid = grids.get((cx + gx - 1, cy + gy - 1))
+        if grid is not None:
+          out[dy, dx] = grid[sy, sx]
+    return out
+
+  # auto_tile_region without numpy, one tile at a time
+  def _auto_tile_slots(self, layer: str, marks: dict, blob: bool) -> int:
+    layer_chunks = self.chunks[layer]
+    tpc = self.tiles_per_chunk
+
+    if marks is None:
+      targets = {chunk_pos: range(tpc * tpc) for chunk_pos in layer_chunks}
+    else:
+      offsets = ((0, 0),) + neighbors + (diagonals if blob else ())
+      targets = {}
+      for (cx, cy), slots in marks.items():
+        for i in slots:
+          x, y = cx * tpc + i % tpc, cy * tpc + i // tpc
+          for ox, oy in offsets:
+            nx, ny = x + ox, y + oy
+            chunk_pos = nx // tpc, ny // tpc
+            if chunk_pos in layer_chunks:
+              if chunk_pos not in targets:
+                targets[chunk_pos] = set()
+              targets[chunk_pos].add(ny % tpc * tpc + nx % tpc)
+
+    updated = 0
+    for (cx, cy), slots in targets.items():
+      chunk = layer_chunks[(cx, cy)]
+      for i in slots:
+        if chunk.ids[i] == EMPTY:
+          continue
+        x, y = cx * tpc + i % tpc, cy * tpc + i // tpc
+        if blob:
+          edges = [self.get_id((x + ex, y + ey), layer) != EMPTY
+                   for ex, ey in neighbors]
+          mask = 0
+          for j, (dx, dy) in enumerate(diagonals):
+            mask += edges[j] << (j * 2)
+            if edges[j] and edges[(j + 1) % 4] and \
+                self.get_id((x + dx, y + dy), layer) != EMPTY:
+              mask += 2 << (j * 2)
+          row = BLOB_ROWS[mask]
+        else:
+          mask = row = self.calculate_bitsum((x, y), layer)
+        chunk.ids[i] = palette.with_row(chunk.ids[i], row)
+        chunk.bits[i] = mask
+        updated += 1
+    if updated:
+      self.version += 1
+    return updated
 
   # culls all tiles within a specified rect
-  def cull(self, layer: str, rect: pygame.Rect, autotile: bool=False) -> int:
-    tiles = self.get_tiles(rect, layer, lambda x: x['pos'], False)
-    for tile_pos in tiles:
-      self.remove_tile(tile_pos, layer, autotile)
-
-  # returns all tiles connected to the tile at pos
-  def select(self, pos: tuple, layer: str) -> list:
-    open_l = [pos]
-    closed_l = []
-
-    if pos not in self.tiles or layer not in self.tiles[pos]:
-      return []
-
-    tiles = []
-
-    while len(open_l) > 0:
-      curr = open_l.pop(0)
-
-      for x, y in neighbors:
-        neighbor = curr[0] + x, curr[1] + y
-        if neighbor in closed_l:
+  def cull(self, layer: str, rect: pygame.Rect,
+           autotile: bool=False) -> Change:
+    change = Change(layer)
+    layer_chunks = self.chunks.get(layer)
+    if not layer_chunks:
+      return change
+
+    x0, y0 = int(rect.x / self.tile_size), int(rect.y / self.tile_size)
+    x1 = x0 + math.ceil(rect.w / self.tile_size)
+    y1 = y0 + math.ceil(rect.h / self.tile_size)
+    tpc = self.tiles_per_chunk
+
+    # chunks fully inside the rect are dropped whole
+    removed = []
+    for cx in range(x0 // tpc, (x1 - 1) // tpc + 1):
+      for cy in range(y0 // tpc, (y1 - 1) // tpc + 1):
+        chunk = layer_chunks.get((cx, cy))
+        if not chunk:
           continue
 
-        if neighbor in self.tiles and layer in self.tiles[neighbor]:
-          open_l.append(neighbor)
+        ox, oy = cx * tpc, cy * tpc
+        if x0 <= ox and ox + tpc <= x1 and y0 <= oy and oy + tpc <= y1:
+          for i, asset_id in enumerate(chunk.ids):
+            if asset_id != EMPTY:
+              removed.append((ox + i % tpc, oy + i // tpc, asset_id))
+          del layer_chunks[(cx, cy)]
+          continue
 
-      closed_l.append(curr)
-      tiles.append(self.tiles[curr][layer]['raw'])
+        for ly in range(max(y0 - oy, 0), min(y1 - oy, tpc)):
+          for lx in range(max(x0 - ox, 0), min(x1 - ox, tpc)):
+            i = ly * tpc + lx
+            if chunk.ids[i] != EMPTY:
+              removed.append((ox + lx, oy + ly, chunk.ids[i]))
+              chunk.ids[i] = EMPTY
+              chunk.count -= 1
+        if not chunk.count:
+          del layer_chunks[(cx, cy)]
+
+    if removed:
+      self.version += 1
+      if layer in self.components:
+        self.components[layer].dirty = True
+
+    # only tiles bordering the culled area need their bitsums updated
+    if autotile:
+      self.auto_tile_region(layer, ((x, y) for x, y, _ in removed))
+
+    t_size = self.tile_size
+    change.removed = [Tile(x * t_size, y * t_size, asset_id)
+                      for x, y, asset_id in removed]
+    return change
+
+  # returns a layer's component index, rebuilding it if tiles were removed
+  def get_components(self, layer: str) -> Components:
+    if layer not in self.components:
+      self.components[layer] = Components()
+    components = self.components[layer]
+    if components.dirty:
+      components.rebuild((x, y) for x, y, _ in self._iter_layer(layer))
+    return components
+
+  # yields (x, y, asset id) for every tile on a layer
+  def _iter_layer(self, layer: str) -> iter:
+    tpc = self.tiles_per_chunk
+    for (cx, cy), chunk in self.chunks.get(layer, {}).items():
+      for i, asset_id in enumerate(chunk.ids):
+        if asset_id != EMPTY:
+          yield cx * tpc + i % tpc, cy * tpc + i // tpc, asset_id
 
-    return tiles
+  # returns all tiles connected to the tile at pos
+  def select(self, pos: tuple, layer: str) -> list:
+    return list(self.iter_component(pos, layer))
 
-  # assumes tiles input is of tile raw data, converts raw data into tiled pos
+  # yields the tiles connected to the tile at pos one at a time
+  def iter_component(self, pos: tuple, layer: str) -> iter:
+    pos = int(pos[0]), int(pos[1])
+    if self.get_id(pos, layer) == EMPTY:
+      return
+    # cells removed while the caller is still iterating are skipped
+    t_size = self.tile_size
+    for x, y in self.get_components(layer).component(pos):
+      asset_id = self.get_id((x, y), layer)
+      if asset_id != EMPTY:
+        yield Tile(x * t_size, y * t_size, asset_id)
+
+  # returns the number of separate groups of connected tiles on a layer
+  def component_count(self, layer: str) -> int:
+    return self.get_components(layer).count
+
+  # returns the number of tiles connected to the tile at pos
+  def component_size(self, pos: tuple, layer: str) -> int:
+    return self.get_components(layer).size((int(pos[0]), int(pos[1])))
+
+  # returns a layer chunk's tiles as a list of [pos, asset] pairs
+  def convert_chunk_to_dict(self, layer: str, chunk_pos: tuple) -> list:
+    tpc = self.tiles_per_chunk
+    x0, y0 = chunk_pos[0] * tpc, chunk_pos[1] * tpc
+    return [[(x, y), palette.assets[asset_id]] for x, y, asset_id in
+            self._iter_window(layer, x0, y0, x0 + tpc, y0 + tpc)]
+
+  # returns the tiles as a dictionary built one chunk at a time, keyed by
+  # layer and then by 'x;y' chunk pos
+  def convert_to_dict(self) -> dict:
+    return {layer: {f'{cx};{cy}': self.convert_chunk_to_dict(layer, (cx, cy))
+                    for cx, cy in self.chunks[layer]}
+            for layer in self.chunks}
+
+  # converts tiles into their tiled pos
   def tilify(self, tiles: list) -> list:
-    tiled = []
-    for (x, y), _ in tiles:
-      tiled.append((x // self.tile_size, y // self.tile_size))
-    return tiled
\ No newline at end of file
+    return list(self.iter_tilify(tiles))
+
+  # yields the tiled positions of tile records one at a time
+  def iter_tilify(self, tiles: iter) -> iter:
+    t_size = self.tile_size
+    for tile in tiles:
+      yield tile.x // t_size, tile.y // t_size
\ No newline at end of file
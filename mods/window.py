@@ -3,6 +3,13 @@ import pygame
 from pygame.draw import *
 from pygame.transform import scale
 
+from mods.assets import palette
+from mods.texcache import TexCache
+from mods.panel import InfoPanel
+
+INFO_FIELDS = ['fps', 'current sheet', 'pen position', 'tool', 'entity type',
+               'layer', 'auto-tile', 'view mode', 'scroll']
+
 
 class Window:
   # init
@@ -31,7 +38,7 @@ class Window:
 
     self.tbar_scroll = 0
 
-    n_sheets = len(self.glob.sheets.sheets)
+    n_sheets = len(self.glob.sheets.sheet_names)
     self.font_size = font_size
     self.tbar_bounds = self.font_size * n_sheets
 
@@ -41,6 +48,7 @@ class Window:
     self.curr_sheet_idx = -1
 
     self.tex_cache = []
+    self.scaled = TexCache()
     self.tex_scroll = 0
     self.tex_scroll_t = 0
     self.tex_scroll_bound = 0
@@ -53,6 +61,7 @@ class Window:
     self.curr_tex_data = None
 
     self.render_cache = {}
+    self.info_panel = None
 
     self.view_modes = ['all', 'focus', 'single']
     self.view_mode_i = 0
@@ -63,10 +72,10 @@ class Window:
   def generate_mask(self) -> pygame.Surface:
     tiles = self.glob.input.selected_tiles
     tile_size = self.glob.TILE_SIZE
-    left = min(tiles, key=lambda x: x[0][0])[0][0]
-    top = min(tiles, key=lambda x: x[0][1])[0][1]
-    right = max(tiles, key=lambda x: x[0][0])[0][0]
-    bottom = max(tiles, key=lambda x: x[0][1])[0][1]
+    left = min(tile.x for tile in tiles)
+    top = min(tile.y for tile in tiles)
+    right = max(tile.x for tile in tiles)
+    bottom = max(tile.y for tile in tiles)
 
     w = right - left
     h = bottom - top
@@ -74,10 +83,11 @@ class Window:
     cached_surf = pygame.Surface((w + tile_size * 3, h + tile_size * 3))
     cached_surf.set_colorkey((0, 0, 0))
 
-    for (x, y), asset_data in tiles:
-        surf = self.glob.sheets.get_asset(*asset_data).copy()
+    for tile in tiles:
+        x, y = tile.x, tile.y
+        surf = self.glob.sheets.get_asset(*tile.asset).copy()
         mask = pygame.mask.from_surface(surf)
-        offx, offy = self.glob.sheets.get_config_info(*asset_data)
+        offx, offy = palette.offsets[tile.asset_id]
 
         mask_surf = mask.to_surface()
         mask_surf.set_colorkey((0, 0, 0))
@@ -173,25 +183,30 @@ class Window:
     # new rendering system for tiles
     layers = self.glob.tilemap.get_visible(self.camera_rect.topleft,
                                           self.camera_rect.size)
+    offsets = palette.offsets
     for i, layer_data in enumerate(layers):
       if self.view_mode_i == 2 and i != self.glob.input._layer:
        continue
 
       layer_cache = {}
 
-      for (x, y), asset_data in layer_data:
-        offx, offy = self.glob.sheets.get_config_info(*asset_data)
+      for tile in layer_data:
+        asset_id = tile.asset_id
+        offx, offy = offsets[asset_id]
 
-        x -= scroll[0] - offx
-        y -= scroll[1] - offy
-        asset_hash = hash(asset_data)
-        if asset_hash not in layer_cache:
-          asset = self.glob.sheets.get_asset(*asset_data).copy()
+        x = tile.x - scroll[0] + offx
+        y = tile.y - scroll[1] + offy
+        if asset_id not in layer_cache:
+          asset_data = palette.assets[asset_id]
           if self.view_mode_i == 1 and i != self.glob.input._layer:
+            asset = self.glob.sheets.get_asset(*asset_data).copy()
             asset.set_alpha(40)
-          layer_cache[asset_hash] = asset
+            layer_cache[asset_id] = asset, None
+          else:
+            layer_cache[asset_id] = self.glob.sheets.get_area(*asset_data)
 
-        self.camera.blit(layer_cache[asset_hash], (x, y))
+        surf, area = layer_cache[asset_id]
+        self.camera.blit(surf, (x, y), area)
 
     # draw tile highlight at current pen position
     if self.sel_tex and self.glob.input.tool == 'draw':
@@ -231,21 +246,23 @@ class Window:
     # window stuff -------------------------------------------------------------
     self.window.fill(accent_c, [0, 0, self.glob.tbar_width, self.height])
 
-    # render info
-    info = f'''
-    fps : {self.glob.clock.fps_info}
-    current sheet : {self.sel_sheet if self.sel_sheet else ''}
-    pen position : {px}, {py}
-    tool : {tool}
-    entity type : {self.glob.input.entity_type}
-    layer : {self.glob.input.layer}
-    auto-tile : {'on' if self.glob.input.auto_tiling else 'off'}
-    view mode : {self.view_modes[self.view_mode_i]}
-    scroll : {self.glob.scroll}
-    '''
-
-    info_loc = self.glob.tbar_width, 0
-    info_surf = self.glob.font.render_txt(info, self.window, info_loc)
+    # render info, fields only redraw when their values change
+    if not self.info_panel:
+      self.info_panel = InfoPanel(self.glob.font, INFO_FIELDS,
+                                  self.width - self.glob.tbar_width)
+
+    info_surf = self.info_panel.update({
+      'fps': self.glob.clock.fps_info,
+      'current sheet': self.sel_sheet if self.sel_sheet else '',
+      'pen position': f'{px}, {py}',
+      'tool': tool,
+      'entity type': self.glob.input.entity_type,
+      'layer': self.glob.input.layer,
+      'auto-tile': 'on' if self.glob.input.auto_tiling else 'off',
+      'view mode': self.view_modes[self.view_mode_i],
+      'scroll': self.glob.scroll[:]
+    })
+    self.window.blit(info_surf, (self.glob.tbar_width, 0))
 
     # render the selected texture
     if self.sel_tex:
@@ -259,6 +276,11 @@ class Window:
     offset = 10
     self.hov_sheet = None
 
+    # pick up palettes scaled in the background
+    if self.scaled.pending:
+      if (self.sel_sheet, self.glob.tex_zoom) in self.scaled.collect():
+        self.show_scaled()
+
     # render textures
     self.hov_tex = None
     if self.sel_sheet:
@@ -295,7 +317,7 @@ class Window:
     self.window.fill(accent_c, (0, 0, self.glob.tbar_width, self.div_height))
 
     # sheet name stuff
-    for i, f in enumerate(self.glob.sheets.sheets):
+    for i, f in enumerate(self.glob.sheets.sheet_names):
 
       y_pos = self.font_size * i + offset
       x_pos = 10
@@ -332,44 +354,74 @@ class Window:
   # sets the current sheet info
   def set_selected_sheet(self, sheet : str) -> None:
     self.sel_sheet = sheet
-    self.curr_sheet = self.glob.sheets.sheets[self.sel_sheet]
-    self.curr_sheet_idx = list(self.glob.sheets.sheets.keys()).index(sheet)
-    self.tex_cache.clear()
-
-    tex_zoom = self.glob.tex_zoom
-    tot_h = 0
-
-    for row in self.curr_sheet:
-
-      new_row = []
-
-      max_h = 0
-
-      for surf in row:
-
-        w = surf.get_width() * tex_zoom
-        h = surf.get_height() * tex_zoom
-
-        scaled_surf = pygame.Surface((w, h))
-        scaled_surf.blit(scale(surf, (w, h)), (0, 0))
-        scaled_surf.set_colorkey((0, 0, 0))
-
-        new_row.append(scaled_surf)
-
-        if h > max_h:
-          max_h = h
-
-      self.tex_cache.append(new_row)
-      tot_h += max_h + 10
-
+    self.curr_sheet = self.glob.sheets.get_sheet(self.sel_sheet)
+    self.curr_sheet_idx = self.glob.sheets.sheet_names.index(sheet)
+    self.show_scaled()
+
+    # get the neighboring sheets ready for cycling
+    names = self.glob.sheets.sheet_names
+    for value in (-1, 1):
+      name = names[(self.curr_sheet_idx + value) % len(names)]
+      if name in self.glob.sheets.sheets:
+        self.scaled.prefetch((name, self.glob.tex_zoom),
+                             self.glob.sheets.sheets[name])
+
+  # shows the selected sheet's scaled textures in the palette, the palette
+  # stays empty until a background scale finishes
+  def show_scaled(self) -> None:
+    scaled = self.scaled.get((self.sel_sheet, self.glob.tex_zoom),
+                             self.curr_sheet)
+    self.tex_cache, tot_h = scaled if scaled else ([], 0)
     self.tex_scroll_bound = tot_h - (self.height - self.div_height * 1.1 - 10)
 
+  # refreshes whatever was cached from sheets that changed on disk
+  def reload_sheets(self, sheets : list) -> None:
+    names = self.glob.sheets.sheet_names
+    self.tbar_bounds = self.font_size * len(names)
+
+    for sheet in sheets:
+      self.scaled.invalidate(sheet)
+    # decor boxes include the config offsets, which may have changed
+    self.glob.tilemap.refresh_off_grid(sheets)
+
+    selected = self.glob.input.selected_tiles or []
+    if any(tile.asset[0] in sheets for tile in selected):
+      self.cached_selection_outline = None
+
+    if self.sel_sheet not in sheets:
+      if self.sel_sheet:
+        self.curr_sheet_idx = names.index(self.sel_sheet)
+      return
+
+    # the selected sheet was removed
+    if self.sel_sheet not in names:
+      self.sel_sheet = None
+      self.curr_sheet = None
+      self.curr_sheet_idx = -1
+      self.tex_cache = []
+      self.sel_tex = None
+      self.curr_tex_data = None
+      return
+
+    # the selected sheet failed to reload and keeps its old textures
+    if self.glob.sheets.file_keys.get(self.sel_sheet) is None:
+      return
+
+    self.set_selected_sheet(self.sel_sheet)
+    if self.curr_tex_data:
+      i, j = self.curr_tex_data
+      if self.glob.sheets.has_asset(self.sel_sheet, i, j):
+        self.set_selected_texture(self.curr_tex_data)
+      else:
+        self.sel_tex = None
+        self.curr_tex_data = None
+
   # sets the current texture info
   def set_selected_texture(self, data : tuple) -> None:
     self.curr_tex_data = data
     i, j = data
 
-    sheet = self.glob.sheets.sheets[self.sel_sheet]
+    sheet = self.glob.sheets.get_sheet(self.sel_sheet)
     self.sel_tex = sheet[i][j]
 
   # update the camera size
@@ -407,9 +459,9 @@ class Window:
   # cycle through the sheets
   def cycle_sheets(self, value : int) -> None:
     self.curr_sheet_idx += value
-    self.curr_sheet_idx %= len(self.glob.sheets.sheets)
+    self.curr_sheet_idx %= len(self.glob.sheets.sheet_names)
 
-    new_sheet = list(self.glob.sheets.sheets.keys())[self.curr_sheet_idx]
+    new_sheet = self.glob.sheets.sheet_names[self.curr_sheet_idx]
     self.set_selected_sheet(new_sheet)
 
   # add value to texture scroll